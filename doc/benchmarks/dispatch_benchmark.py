@@ -0,0 +1,112 @@
+# Benchmark of the docutils dispatch diagnostics modes of the 'exqudens_sphinx' extension.
+#
+# Every mode runs in its own process, because the extension patches docutils globally:
+#
+#   python doc/benchmarks/dispatch_benchmark.py --sections 2000 --repeat 5
+import gc
+import sys
+import json
+import time
+import types
+import argparse
+import subprocess
+from pathlib import Path
+
+import docutils.nodes
+import docutils.utils
+import docutils.frontend
+import docutils.parsers.rst
+
+modes = ['unpatched', 'off', 'cheap', 'full']
+
+
+class BenchmarkVisitor(docutils.nodes.GenericNodeVisitor):
+
+    def default_visit(self, node):
+        pass
+
+    def default_departure(self, node):
+        pass
+
+
+def create_document(sections):
+    settings = docutils.frontend.get_default_settings(docutils.parsers.rst.Parser)
+    document = docutils.utils.new_document('benchmark', settings)
+    for section_index in range(sections):
+        section = docutils.nodes.section()
+        section += docutils.nodes.title(text=f"Section {section_index}")
+        for paragraph_index in range(10):
+            paragraph = docutils.nodes.paragraph()
+            paragraph += docutils.nodes.Text(f"Paragraph {paragraph_index} ")
+            paragraph += docutils.nodes.emphasis(text='emphasis')
+            section += paragraph
+        document += section
+    return document
+
+
+def run_mode(mode, sections, repeat):
+    # imported in every mode, so all modes run with the same modules loaded
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    from exqudens_sphinx import docutils_patch
+
+    if mode != 'unpatched':
+        docutils_patch.install(types.SimpleNamespace(
+            docutils_dispatch_diagnostics=mode,
+            docutils_text_visited_nodes_size=10
+        ))
+
+    document = create_document(sections)
+    node_count = len(list(document.traverse()))
+    visitor = BenchmarkVisitor(document)
+    times = []
+
+    for i in range(repeat):
+        gc.collect()
+        gc.disable()
+        start = time.perf_counter()
+        document.walkabout(visitor)
+        times.append(time.perf_counter() - start)
+        gc.enable()
+
+    return {'mode': mode, 'nodes': node_count, 'seconds': min(times)}
+
+
+def main(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=modes)
+    parser.add_argument('--sections', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    options = parser.parse_args(args)
+
+    if options.mode is not None:
+        print(json.dumps(run_mode(options.mode, options.sections, options.repeat)))
+        return 0
+
+    results = []
+
+    for mode in modes:
+        output = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                '--mode', mode,
+                '--sections', str(options.sections),
+                '--repeat', str(options.repeat)
+            ],
+            check=True,
+            capture_output=True,
+            text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    base = results[0]['seconds']
+
+    for result in results:
+        overhead = (result['seconds'] / base - 1) * 100
+        print(f"-- {result['mode']}: nodes: {result['nodes']} seconds: {result['seconds']:.4f} overhead: {overhead:+.1f}%")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
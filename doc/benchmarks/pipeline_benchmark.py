@@ -0,0 +1,334 @@
+# Benchmark of the documentation pipeline on synthetic inputs, offline:
+#
+#   python doc/benchmarks/pipeline_benchmark.py --output build/benchmarks/pipeline.json
+#   python doc/benchmarks/pipeline_benchmark.py --update-baseline
+#
+# Fails if any result is slower than the stored baseline by more than the tolerance.
+# The baseline depends on the machine, it is compared only on the same environment and parameters,
+# it is updated with '--update-baseline'.
+import gc
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import sphinx
+import docutils
+import docutils.nodes
+import docutils.utils
+import docutils.frontend
+import docutils.parsers.rst
+from sphinx import addnodes
+from sphinx.application import Sphinx
+from sphinx.util.docutils import docutils_namespace
+from sphinx.util.docutils import patch_docutils
+from breathe.renderer.filter import FilterFactory
+
+from exqudens_sphinx import breathe_patch
+from exqudens_sphinx import docxbuilder_patch
+from exqudens_sphinx import fixups
+from exqudens_sphinx.util import create_lru_cache
+
+doc_dir = Path(__file__).parent.parent
+baseline_file = Path(__file__).parent.joinpath('pipeline_baseline.json')
+
+
+def create_doctree(sections):
+    settings = docutils.frontend.get_default_settings(docutils.parsers.rst.Parser)
+    document = docutils.utils.new_document('benchmark', settings)
+    for section_index in range(sections):
+        section = docutils.nodes.section()
+        section += docutils.nodes.title(text=f"Section {section_index}")
+
+        paragraph = docutils.nodes.paragraph()
+        paragraph += docutils.nodes.Text('Paragraph with a nested list ')
+        bullet_list = docutils.nodes.bullet_list()
+        for item_index in range(3):
+            item_paragraph = docutils.nodes.paragraph()
+            item_paragraph += docutils.nodes.Text(f"Item {item_index} ")
+            item_paragraph += docutils.nodes.literal_block(text='code')
+            enumerated_list = docutils.nodes.enumerated_list(enumtype='loweralpha')
+            enumerated_list += docutils.nodes.list_item('', docutils.nodes.paragraph(text='Nested'))
+            item_paragraph += enumerated_list
+            bullet_list += docutils.nodes.list_item('', item_paragraph)
+        paragraph += bullet_list
+        section += paragraph
+
+        table = docutils.nodes.table()
+        group = docutils.nodes.tgroup(cols=2)
+        group += docutils.nodes.colspec(colwidth='auto')
+        group += docutils.nodes.colspec(colwidth='auto')
+        body = docutils.nodes.tbody()
+        for row_index in range(3):
+            row = docutils.nodes.row()
+            row += docutils.nodes.entry('', docutils.nodes.paragraph(text=f"Key {row_index}"))
+            row += docutils.nodes.entry('', docutils.nodes.paragraph(text=f"Value {row_index}"))
+            body += row
+        group += body
+        table += group
+        section += table
+
+        desc = addnodes.desc()
+        desc += addnodes.desc_signature(text=f"void f{section_index}()")
+        content = addnodes.desc_content()
+        content += docutils.nodes.paragraph('', '', docutils.nodes.Text('Brief '), docutils.nodes.literal_block(text='example'))
+        content += docutils.nodes.container('', docutils.nodes.emphasis(text='note'))
+        desc += content
+        section += desc
+
+        document += section
+    return document
+
+
+def create_doxygen_xml(path, compounds, members):
+    path.mkdir(parents=True, exist_ok=True)
+    index_lines = ["<?xml version='1.0' encoding='UTF-8' standalone='no'?>", '<doxygenindex version="1.9.1">']
+    for compound_index in range(compounds):
+        name = f"Class{compound_index}"
+        refid = f"class{name}"
+        index_lines.append(f'  <compound refid="{refid}" kind="class"><name>{name}</name></compound>')
+        member_lines = []
+        for member_index in range(members):
+            member_lines.append(
+                f'<memberdef kind="function" id="{refid}_{member_index}" prot="public" static="no" const="no" explicit="no" inline="no" virt="non-virtual">'
+                f'<type>int</type><definition>int {name}::f{member_index}</definition><argsstring>(int a)</argsstring><name>f{member_index}</name>'
+                f'<param><type>int</type><declname>a</declname></param>'
+                f'<briefdescription><para>Brief {member_index}.</para></briefdescription>'
+                f'<detaileddescription><para>Detail with <computeroutput>code</computeroutput>.</para></detaileddescription>'
+                f'<location file="{name}.hpp" line="{member_index + 1}"/></memberdef>'
+            )
+        path.joinpath(f"{refid}.xml").write_text(
+            "<?xml version='1.0' encoding='UTF-8' standalone='no'?>\n"
+            '<doxygen version="1.9.1">'
+            f'<compounddef id="{refid}" kind="class" language="C++" prot="public"><compoundname>{name}</compoundname>'
+            f'<sectiondef kind="public-func">{"".join(member_lines)}</sectiondef>'
+            f'<briefdescription><para>Brief of {name}.</para></briefdescription><detaileddescription></detaileddescription>'
+            f'<location file="{name}.hpp" line="1"/></compounddef></doxygen>\n'
+        )
+    index_lines.append('</doxygenindex>')
+    path.joinpath('index.xml').write_text('\n'.join(index_lines) + '\n')
+
+
+def create_project(path, sections, compounds, rendered_compounds, members):
+    path.joinpath('name-version.txt').write_text('benchmark: 1.0.0\n')
+    create_doxygen_xml(path.joinpath('build', 'doxygen', 'main', 'xml'), compounds, members)
+
+    source_dir = path.joinpath('source')
+    source_dir.mkdir(parents=True)
+    shutil.copy2(doc_dir.joinpath('conf.py'), source_dir.joinpath('conf.py'))
+    source_dir.joinpath('conf.json').write_text(json.dumps({
+        'PROJECT_DIR': str(path),
+        'PROJECT_BREATHE_DEFAULT': 'main',
+        'PROJECT_TITLE': 'benchmark'
+    }))
+    source_dir.joinpath('index.rst').write_text('#####\nIndex\n#####\n\n.. toctree::\n\n   synthetic\n   api\n')
+
+    lines = ['#########', 'Synthetic', '#########', '']
+    for section_index in range(sections):
+        lines += [
+            f"Section {section_index}", '=' * len(f"Section {section_index}"), '',
+            f".. item:: REQ_{section_index} Requirement {section_index}",
+            f"   :depends_on: REQ_{max(section_index - 1, 0)}", '',
+            '   Requirement text with *emphasis*.', '',
+            '- Item with a paragraph', '',
+            '  #. Nested', '  #. List', '',
+            '.. list-table::', '', '   * - Key', '     - Value', '   * - Other', '     - Value', '',
+            '.. note::', '', '   Note text.', ''
+        ]
+    source_dir.joinpath('synthetic.rst').write_text('\n'.join(lines))
+
+    lines = ['###', 'API', '###', '']
+    for compound_index in range(rendered_compounds):
+        lines += [f".. doxygenclass:: Class{compound_index}", '   :members:', '']
+    source_dir.joinpath('api.rst').write_text('\n'.join(lines))
+
+    return source_dir
+
+
+def measure(function, repeat, setup=None):
+    times = []
+    for i in range(repeat):
+        argument = None if setup is None else setup()
+        gc.collect()
+        gc.disable()
+        start = time.perf_counter()
+        function(argument)
+        times.append(time.perf_counter() - start)
+        gc.enable()
+    return min(times)
+
+
+def build(source_dir, output_dir, builder):
+    # nothing parsed by a previous build is reused
+    breathe_patch.breathe_parser_cache = create_lru_cache(breathe_patch.breathe_parser_cache['size'])
+    with patch_docutils(str(source_dir)), docutils_namespace():
+        app = Sphinx(
+            str(source_dir),
+            str(source_dir),
+            str(output_dir.joinpath(builder)),
+            str(output_dir.joinpath('doctrees')),
+            builder,
+            confoverrides={'breathe_parser_cache_persistent': False},
+            status=None,
+            warning=None,
+            freshenv=True
+        )
+        app.build()
+    return app
+
+
+def run(options, work_dir):
+    results = {}
+
+    doctree = create_doctree(options.sections)
+    results['fixups_fix_node'] = measure(
+        lambda tree: fixups.fixups_fix_node(tree, include_self=False),
+        options.repeat,
+        setup=doctree.deepcopy
+    )
+
+    source_dir = create_project(
+        work_dir,
+        options.build_sections,
+        options.compounds,
+        options.build_compounds,
+        options.members
+    )
+    xml_dir = work_dir.joinpath('build', 'doxygen', 'main', 'xml')
+
+    def parse_doxygen(argument):
+        breathe_patch.breathe_parser_cache = create_lru_cache(options.compounds + 1)
+        breathe_patch.breathe_preload_parser_cache(str(xml_dir))
+
+    results['doxygen_parse'] = measure(parse_doxygen, options.repeat)
+
+    results['html_build'] = measure(
+        lambda argument: build(source_dir, work_dir.joinpath('html'), 'html'),
+        options.build_repeat
+    )
+
+    app = None
+
+    def build_docx(argument):
+        nonlocal app
+        app = build(source_dir, work_dir.joinpath('docx'), 'docx')
+
+    results['docx_build'] = measure(build_docx, options.build_repeat)
+
+    # the application of the last docx build, with the environment of the synthetic project,
+    # not chunked, the chunked one assembles the included documents on writing, see 'docxbuilder_new_write_doc'
+    app.config.docxbuilder_assemble_doctree_chunked = False
+
+    def assemble_doctree(argument):
+        try:
+            app.builder.assemble_doctree('index', False)
+        finally:
+            docxbuilder_patch.docxbuilder_chunk_context = None
+
+    app.config.docxbuilder_assemble_doctree_cache = False
+    results['assemble_doctree'] = measure(assemble_doctree, options.repeat)
+    app.config.docxbuilder_assemble_doctree_cache = True
+    results['assemble_doctree_cached'] = measure(assemble_doctree, options.repeat)
+
+    factory = FilterFactory(app)
+    options_list = [
+        {'members': ''},
+        {'members': '', 'protected-members': ''},
+        {'members': '', 'private-members': '', 'undoc-members': ''},
+        {'members': 'f0, f1', 'outline': ''}
+    ]
+
+    def create_filters(argument):
+        for i in range(options.filters):
+            filter_options = options_list[i % len(options_list)]
+            for kind in ['group', 'page', 'namespace']:
+                factory.create_content_filter(kind, filter_options)
+                factory.create_render_filter(kind, filter_options)
+
+    breathe_patch.breathe_content_filter_cache = create_lru_cache(0)
+    breathe_patch.breathe_render_filter_cache = create_lru_cache(0)
+    results['filter_factories'] = measure(create_filters, options.repeat)
+    breathe_patch.breathe_content_filter_cache = create_lru_cache(app.config.breathe_filter_cache_size)
+    breathe_patch.breathe_render_filter_cache = create_lru_cache(app.config.breathe_filter_cache_size)
+    results['filter_factories_cached'] = measure(create_filters, options.repeat)
+
+    return results
+
+
+def main(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sections', type=int, default=2000)
+    parser.add_argument('--compounds', type=int, default=2000)
+    parser.add_argument('--build-sections', type=int, default=200)
+    parser.add_argument('--build-compounds', type=int, default=100)
+    parser.add_argument('--members', type=int, default=5)
+    parser.add_argument('--filters', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--build-repeat', type=int, default=1)
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    parser.add_argument('--baseline', default=str(baseline_file))
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--output')
+    options = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = run(options, Path(work_dir))
+
+    report = {
+        'environment': {
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'python': platform.python_version(),
+            'sphinx': sphinx.__version__,
+            'docutils': docutils.__version__
+        },
+        'parameters': {
+            'sections': options.sections,
+            'compounds': options.compounds,
+            'build_sections': options.build_sections,
+            'build_compounds': options.build_compounds,
+            'members': options.members,
+            'filters': options.filters
+        },
+        'seconds': results
+    }
+
+    if options.output is not None:
+        Path(options.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(options.output).write_text(json.dumps(report, indent=4))
+
+    if options.update_baseline:
+        Path(options.baseline).write_text(json.dumps(report, indent=4) + '\n')
+
+    baseline = {}
+    if Path(options.baseline).is_file():
+        baseline = json.loads(Path(options.baseline).read_text())
+        if baseline.get('environment') != report['environment']:
+            print(f"-- baseline environment differs, not compared: {baseline.get('environment')}")
+            baseline = {}
+        elif baseline['parameters'] != report['parameters']:
+            print(f"-- baseline parameters differ, not compared: {baseline['parameters']}")
+            baseline = {}
+
+    failed = []
+
+    for name, seconds in results.items():
+        limit = None if name not in baseline.get('seconds', {}) else baseline['seconds'][name] * (1 + options.tolerance)
+        status = '' if limit is None else ('FAILED' if seconds > limit else 'OK')
+        print(f"-- {name}: seconds: {seconds:.4f}" + ('' if limit is None else f" limit: {limit:.4f} {status}"))
+        if status == 'FAILED':
+            failed.append(name)
+
+    return 1 if len(failed) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
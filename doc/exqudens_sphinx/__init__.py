@@ -0,0 +1,26 @@
+from . import builders
+from . import docutils_patch
+from . import breathe_patch
+from . import docxbuilder_patch
+from . import rst2pdf_patch
+from . import traceability_patch
+from . import generated_includes
+from . import image_cache
+from . import profiling
+
+
+def setup(app):
+    builders.setup(app)
+    docutils_patch.setup(app)
+    breathe_patch.setup(app)
+    docxbuilder_patch.setup(app)
+    rst2pdf_patch.setup(app)
+    traceability_patch.setup(app)
+    generated_includes.setup(app)
+    image_cache.setup(app)
+    profiling.setup(app)
+
+    return {
+        'parallel_read_safe': True,
+        'parallel_write_safe': True
+    }
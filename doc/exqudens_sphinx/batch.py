@@ -0,0 +1,268 @@
+"""
+Builds several sphinx-doc targets in one process, or in a pool of worker processes.
+
+Every target is the equivalent of one 'sphinx' command of the 'sphinx-doc*' cmake targets:
+
+    {
+        "targets": [
+            {
+                "name": "sphinx-doc-requirements",
+                "conf_json_vars": ["PROJECT_TITLE=exqudens-cpp-sphinx designs", "PROJECT_BREATHE_DEFAULT=main"],
+                "output_dir": "build/doc/requirements",
+                "files": ["requirements/requirements.rst"],
+                "extra_files": [],
+                "builders": ["html", "docx"]
+            }
+        ]
+    }
+
+'PROJECT_DIR' is set to the project directory, unless it is in 'conf_json_vars',
+and '${PROJECT_DIR}' in the values is replaced with it.
+
+With '--concurrent-builders' the first builder of a target reads the sources, and the other builders
+write the environment it resolved in worker processes, while it writes its own output.
+
+Usage:
+
+    python doc/exqudens_sphinx/batch.py doc/sphinx-doc-all.json --jobs 2 --report build/doc/batch.json
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+if __package__ in [None, '']:
+    # run as a script, 'doc' instead of 'doc/exqudens_sphinx'
+    sys.path[0] = str(Path(__file__).parent.parent)
+
+from sphinx.application import Sphinx
+from sphinx.config import eval_config_file
+from sphinx.util.docutils import docutils_namespace
+from sphinx.util.docutils import patch_docutils
+
+# the imports shared by all targets
+import breathe
+import docxbuilder
+import mlx.traceability
+import rst2pdf.pdfbuilder
+
+from exqudens_sphinx import builders
+from exqudens_sphinx import breathe_patch
+
+doc_dir = Path(__file__).parent.parent
+project_dir = doc_dir.parent
+
+
+def parse_conf_json_vars(values, project_dir):
+    result = {'PROJECT_DIR': str(project_dir)}
+    for value in values:
+        if '=' not in value:
+            raise Exception(f"Invalid conf json var: '{value}'")
+        key, value = value.split('=', 1)
+        result[key] = value
+    return {key: value.replace('${PROJECT_DIR}', result['PROJECT_DIR']) for key, value in result.items()}
+
+
+def write_if_changed(path, text):
+    # unchanged files keep the modification time, so sphinx does not read them again
+    if path.is_file() and path.read_text() == text:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def stage_target(target, project_dir):
+    conf_json = parse_conf_json_vars(target.get('conf_json_vars', []), project_dir)
+    output_dir = Path(project_dir).joinpath(target['output_dir'])
+    source_dir = output_dir.joinpath('source')
+    source_doc_dir = Path(conf_json['PROJECT_DIR']).joinpath('doc')
+
+    for file in ['conf.py'] + target.get('files', []) + target.get('extra_files', []):
+        source = source_doc_dir.joinpath(file)
+        destination = source_dir.joinpath(file)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(source, destination)
+
+    write_if_changed(source_dir.joinpath('conf.json'), json.dumps(conf_json, indent=4))
+
+    title = conf_json.get('PROJECT_TITLE', target['name'])
+    index_lines = ['#' * len(title), title, '#' * len(title), '', '.. toctree::', '']
+    index_lines += ['   ' + str(Path(file).with_suffix('').as_posix()) for file in target.get('files', [])]
+    write_if_changed(source_dir.joinpath('index.rst'), '\n'.join(index_lines) + '\n')
+
+    return source_dir, output_dir
+
+
+def read_breathe_projects(source_dir):
+    # the breathe projects of the staged 'conf.py'
+    cwd = os.getcwd()
+    os.chdir(source_dir)
+    try:
+        namespace = eval_config_file(str(source_dir.joinpath('conf.py')), None)
+    finally:
+        os.chdir(cwd)
+    return namespace.get('breathe_projects', {})
+
+
+def preload_doxygen(source_dir):
+    # the breathe projects of the target, parsed before the worker processes are started
+    result = {}
+    for name, path in read_breathe_projects(source_dir).items():
+        if Path(path).joinpath('index.xml').is_file():
+            result[name] = breathe_patch.breathe_preload_parser_cache(path)
+    return result
+
+
+def create_app(target, source_dir, output_dir, builder, freshenv=False):
+    return Sphinx(
+        str(source_dir),
+        str(source_dir),
+        str(output_dir.joinpath(builder)),
+        str(output_dir.joinpath('doctrees')),
+        builder,
+        freshenv=freshenv,
+        warningiserror=target.get('warnings_to_errors', False)
+    )
+
+
+def write_builder(target, source_dir, output_dir, builder, env):
+    # the output of one builder from the environment resolved by another process
+    result = {'builder': builder, 'status': 0}
+    start = time.perf_counter()
+
+    cwd = os.getcwd()
+    os.chdir(source_dir)
+    builders.builders_resolved_env = env
+    try:
+        with patch_docutils(str(source_dir)), docutils_namespace():
+            app = create_app(target, source_dir, output_dir, builder)
+            app.build(force_all=True)
+            result['status'] = app.statuscode
+    except Exception as e:
+        result['status'] = 1
+        result['error'] = f"{builder}: {e}"
+    finally:
+        builders.builders_resolved_env = None
+        os.chdir(cwd)
+
+    result['time'] = time.perf_counter() - start
+    return result
+
+
+def build_target(target, project_dir, concurrent_builders=False):
+    result = {'name': target['name'], 'status': 0, 'timings': {}}
+    start = time.perf_counter()
+
+    source_dir, output_dir = stage_target(target, project_dir)
+    result['timings']['stage'] = time.perf_counter() - start
+
+    target_builders = target.get('builders', ['html'])
+    executor = None
+    futures = []
+
+    def submit_builders(app, env):
+        # after the consistency check of the other extensions, the environment is resolved
+        data = pickle.dumps(env, pickle.HIGHEST_PROTOCOL)
+        for builder in target_builders[1:]:
+            futures.append(executor.submit(write_builder, target, source_dir, output_dir, builder, data))
+
+    # relative paths of 'conf.json' are relative to the staged sources
+    cwd = os.getcwd()
+    os.chdir(source_dir)
+    try:
+        for builder in target_builders:
+            if builder in result['timings']:
+                continue
+            builder_start = time.perf_counter()
+            try:
+                with patch_docutils(str(source_dir)), docutils_namespace():
+                    app = create_app(target, source_dir, output_dir, builder)
+                    if concurrent_builders and executor is None and len(target_builders) > 1:
+                        executor = ProcessPoolExecutor(max_workers=len(target_builders) - 1)
+                        app.connect('env-check-consistency', submit_builders, priority=999)
+                    app.build()
+                    result['status'] = max(result['status'], app.statuscode)
+            except Exception as e:
+                result['status'] = 1
+                result['error'] = f"{builder}: {e}"
+            result['timings'][builder] = time.perf_counter() - builder_start
+
+            # the other builders are written by the workers, unless nothing was read
+            for future in futures:
+                builder_result = future.result()
+                result['status'] = max(result['status'], builder_result['status'])
+                result['timings'][builder_result['builder']] = builder_result['time']
+                if 'error' in builder_result:
+                    result['error'] = builder_result['error']
+            futures.clear()
+    finally:
+        os.chdir(cwd)
+        if executor is not None:
+            executor.shutdown()
+
+    result['timings']['total'] = time.perf_counter() - start
+    return result
+
+
+def build_targets(targets, project_dir, jobs=1, concurrent_builders=False):
+    if jobs <= 1:
+        return [build_target(target, project_dir, concurrent_builders) for target in targets]
+
+    # the workers are forked where possible, so they share the imports and the preloaded doxygen data
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(build_target, target, project_dir, concurrent_builders) for target in targets]
+        return [future.result() for future in futures]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('targets_file')
+    parser.add_argument('--project-dir', default=str(project_dir))
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--target', action='append', default=[])
+    parser.add_argument('--no-preload', action='store_true')
+    parser.add_argument('--concurrent-builders', action='store_true')
+    parser.add_argument('--report')
+    args = parser.parse_args(args)
+
+    targets = json.loads(Path(args.targets_file).read_text())['targets']
+    if len(args.target) > 0:
+        targets = [target for target in targets if target['name'] in args.target]
+
+    start = time.perf_counter()
+    preloaded = {}
+    if not args.no_preload and len(targets) > 0:
+        source_dir, output_dir = stage_target(targets[0], args.project_dir)
+        preloaded = preload_doxygen(source_dir)
+    preload_time = time.perf_counter() - start
+
+    results = build_targets(targets, args.project_dir, args.jobs, args.concurrent_builders)
+
+    report = {
+        'jobs': args.jobs,
+        'concurrent_builders': args.concurrent_builders,
+        'preload': {'time': preload_time, 'compounds': preloaded},
+        'targets': results,
+        'total': time.perf_counter() - start
+    }
+
+    print(f"-- preload: {preload_time:.3f}s {preloaded}")
+    for result in results:
+        timings = ' '.join(f"{name}: {value:.3f}s" for name, value in result['timings'].items())
+        print(f"-- {result['name']}: status: {result['status']} {timings}" + (f" error: {result['error']}" if 'error' in result else ''))
+    print(f"-- total: {report['total']:.3f}s")
+
+    if args.report is not None:
+        Path(args.report).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.report).write_text(json.dumps(report, indent=4))
+
+    return max([result['status'] for result in results] + [0])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
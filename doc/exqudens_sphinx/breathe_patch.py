@@ -0,0 +1,586 @@
+import os
+import gc
+import zlib
+import pickle
+import hashlib
+import inspect
+from pathlib import Path
+
+import sphinx.util
+import breathe
+import breathe.parser.index
+import breathe.parser.compound
+import breathe.file_state_cache
+from breathe.file_state_cache import MTimeError
+from breathe.finder import stack
+from breathe.finder.index import CompoundTypeSubItemFinder
+from breathe.renderer.filter import FilterFactory
+from breathe.renderer.filter import OrFilter
+from breathe.renderer.filter import AndFilter
+from breathe.renderer.filter import OpenFilter
+from breathe.renderer.filter import ClosedFilter
+from breathe.renderer.filter import NotFilter
+from breathe.renderer.filter import UnrecognisedKindError
+from breathe.renderer.filter import Node
+from breathe.renderer.filter import Parent
+from breathe.renderer.filter import Ancestor
+from breathe.renderer.filter import HasAncestorFilter
+from breathe.renderer.filter import InFilter
+from breathe.renderer.filter import FilePathFilter
+from breathe.renderer.filter import NodeTypeAccessor
+from breathe.renderer.filter import KindAccessor
+
+from .util import freeze
+from .util import create_lru_cache
+from .util import lru_cache_get
+from .util import file_digest
+from .util import atomic_write
+from .util import prune_cache_dir
+
+logger = sphinx.util.logging.getLogger(__name__)
+
+breathe_old_create_content_filter = FilterFactory.create_content_filter
+breathe_old_create_render_filter = FilterFactory.create_render_filter
+breathe_old_parse_index = breathe.parser.index.parse
+breathe_old_parse_compound = breathe.parser.compound.parse
+breathe_old_file_state_update = breathe.file_state_cache.update
+breathe_old_compound_finder_filter = CompoundTypeSubItemFinder.filter_
+
+# per-process state, every worker process of a parallel build has its own
+breathe_content_filter_cache = create_lru_cache(128)
+breathe_render_filter_cache = create_lru_cache(128)
+breathe_filter_cache_snapshots = {}
+
+# kept across the applications of one process, see 'exqudens_sphinx.batch'
+breathe_parser_cache = create_lru_cache(1024)
+
+# on-disk cache of the parsed files, keyed by the content hash, 'None' if disabled
+breathe_parser_cache_dir = None
+breathe_parser_cache_dir_stats = {'hits': 0, 'misses': 0}
+# the files read by the finder of a compound, recorded only if the compound matched, 'None' outside of it
+breathe_file_state_deferred = None
+# the compound files are read by the finders only if the filter can match something in them
+breathe_lazy_compound_files = False
+# the scope of the finder filter of the directive being read, see 'breathe_filter_scope'
+breathe_compound_scope = {'filter': None, 'scope': None}
+
+# the node types of the compound files, the other ones are in the 'index.xml'
+breathe_compound_file_node_types = frozenset(['compounddef', 'sectiondef', 'memberdef', 'enumvalue', 'ref'])
+
+
+class BreatheParserFactoryCache(dict):
+    # the cache of 'breathe.parser.DoxygenParserFactory' keeps every parsed file until the end of the build,
+    # nothing is stored in it, the parsed files are kept by the bounded 'breathe_parser_cache' instead
+    def __setitem__(self, key, value):
+        pass
+
+
+def breathe_create_prot_filter(selector, options):
+    prots = {
+        'members': 'public',
+        'protected-members': 'protected',
+        'private-members': 'private'
+    }
+    allowed = frozenset(prot for option, prot in prots.items() if option in options)
+
+    if len(allowed) == 0:
+        return ClosedFilter()
+
+    return selector.prot.is_one_of(allowed)
+
+
+def breathe_fold_filter(value):
+    if isinstance(value, NotFilter):
+        child = breathe_fold_filter(value.child_filter)
+        if isinstance(child, OpenFilter):
+            return ClosedFilter()
+        if isinstance(child, ClosedFilter):
+            return OpenFilter()
+        if isinstance(child, NotFilter):
+            return child.child_filter
+        return NotFilter(child)
+
+    if isinstance(value, (AndFilter, OrFilter)):
+        # Closed AND x is Closed, Open AND x is x, Open OR x is Open, Closed OR x is x
+        if isinstance(value, AndFilter):
+            neutral, absorbing = OpenFilter, ClosedFilter
+        else:
+            neutral, absorbing = ClosedFilter, OpenFilter
+        filters = []
+        for f in value.filters:
+            f = breathe_fold_filter(f)
+            if isinstance(f, absorbing):
+                return absorbing()
+            if isinstance(f, neutral):
+                continue
+            if type(f) is type(value):
+                filters.extend(f.filters)
+            else:
+                filters.append(f)
+        if len(filters) == 0:
+            return neutral()
+        if len(filters) == 1:
+            return filters[0]
+        return type(value)(*filters)
+
+    return value
+
+
+def breathe_new_create_content_filter(self, kind, options):
+    if not self.app.config.breathe_new_create_content_filter_apply:
+        return breathe_old_create_content_filter(self, kind, options)
+
+    if self.app.config.breathe_new_create_content_filter_log:
+        logger.info(f"-- {inspect.currentframe().f_code.co_name} call")
+
+    if kind not in ["group", "page", "namespace"]:
+        raise UnrecognisedKindError(kind)
+
+    node = Node()
+
+    # Filter for public memberdefs
+    node_is_memberdef = node.node_type == "memberdef"
+    node_is_visible = breathe_create_prot_filter(node, options)
+
+    visible_members = node_is_memberdef & node_is_visible
+
+    # Filter for public innerclasses
+    parent = Parent()
+    parent_is_compounddef = parent.node_type == "compounddef"
+    parent_is_class = parent.kind == kind
+
+    node_is_innerclass = (node.node_type == "ref") & (node.node_name == "innerclass")
+    node_is_visible = breathe_create_prot_filter(node, options)
+
+    public_innerclass = (
+        parent_is_compounddef & parent_is_class & node_is_innerclass & node_is_visible
+    )
+
+    return breathe_fold_filter(visible_members | public_innerclass)
+
+
+def breathe_cached_create_content_filter(self, kind, options):
+    key = (kind, freeze(options), self.app.config.breathe_new_create_content_filter_apply)
+    return lru_cache_get(
+        breathe_content_filter_cache,
+        key,
+        lambda: breathe_new_create_content_filter(self, kind, options)
+    )
+
+
+def breathe_new_create_render_filter(self, kind, options):
+    if not self.app.config.breathe_new_create_render_filter_apply:
+        return breathe_old_create_render_filter(self, kind, options)
+
+    if self.app.config.breathe_new_create_render_filter_log:
+        logger.info(f"-- {inspect.currentframe().f_code.co_name} call")
+
+    if kind not in ["group", "page", "namespace"]:
+        raise UnrecognisedKindError(kind)
+
+    # Generate new dictionary from defaults
+    filter_options = dict((entry, "") for entry in self.app.config.breathe_default_members)
+
+    # Update from the actual options
+    filter_options.update(options)
+
+    # Convert the doxygengroup members flag (which just stores None as the value) to an empty
+    # string to allow the create_class_member_filter to process it properly
+    if "members" in filter_options:
+        filter_options["members"] = ""
+
+    if "desc-only" in filter_options:
+        return self._create_description_filter(True, "compounddef", options)
+
+    node = Node()
+    grandparent = Ancestor(2)
+    has_grandparent = HasAncestorFilter(2)
+
+    non_class_memberdef = (
+        has_grandparent
+        & (grandparent.node_type == "compounddef")
+        & ~grandparent.kind.is_one_of(frozenset(["class", "struct", "interface"]))
+        & (node.node_type == "memberdef")
+    )
+
+    non_class_filter = AndFilter(
+        non_class_memberdef,
+        breathe_create_prot_filter(node, options)
+    )
+
+    return breathe_fold_filter(
+        (self.create_class_member_filter(filter_options) | non_class_filter)
+        & self.create_innerclass_filter(filter_options)
+        & self.create_outline_filter(filter_options)
+    )
+
+
+def breathe_cached_create_render_filter(self, kind, options):
+    key = (
+        kind,
+        freeze(options),
+        freeze(self.app.config.breathe_default_members),
+        self.app.config.breathe_new_create_render_filter_apply
+    )
+    return lru_cache_get(
+        breathe_render_filter_cache,
+        key,
+        lambda: breathe_new_create_render_filter(self, kind, options)
+    )
+
+
+def breathe_filter_scope(filter_):
+    # the node types, kinds and file names the node tested by the filter must have to match,
+    # a missing entry allows any, 'Node()' is the node itself, the other selectors are not considered
+    if isinstance(filter_, InFilter) and type(filter_.accessor.selector) is Node:
+        if type(filter_.accessor) is NodeTypeAccessor:
+            return {'node_type': frozenset(filter_.members)}
+        if type(filter_.accessor) is KindAccessor:
+            return {'kind': frozenset(filter_.members)}
+        return {}
+
+    if isinstance(filter_, FilePathFilter) and type(filter_.accessor.selector) is Node:
+        # with or without the directories the name of the file is the same as the one of the location
+        return {'file': frozenset([filter_.target_file.replace('\\', '/').split('/')[-1]])}
+
+    if isinstance(filter_, AndFilter):
+        scope = {}
+        for f in filter_.filters:
+            for name, values in breathe_filter_scope(f).items():
+                scope[name] = values if name not in scope else scope[name] & values
+        return scope
+
+    if isinstance(filter_, OrFilter):
+        scopes = [breathe_filter_scope(f) for f in filter_.filters]
+        return {name: frozenset().union(*(s[name] for s in scopes)) for name in scopes[0] if all(name in s for s in scopes)}
+
+    return {}
+
+
+def breathe_compound_may_match(filter_, compound):
+    # whether anything in the file of the compound of the 'index.xml' can match the filter
+    if breathe_compound_scope['filter'] is not filter_:
+        breathe_compound_scope['filter'] = filter_
+        breathe_compound_scope['scope'] = breathe_filter_scope(filter_)
+    scope = breathe_compound_scope['scope']
+
+    node_types = scope.get('node_type')
+    if node_types is None:
+        return True
+    if node_types.isdisjoint(breathe_compound_file_node_types):
+        return False
+    if node_types == {'compounddef'}:
+        # the compound file has one 'compounddef', its kind and name are the ones of the compound
+        if 'kind' in scope and compound.kind not in scope['kind']:
+            return False
+        if 'file' in scope and compound.kind == 'file' and compound.name.replace('\\', '/').split('/')[-1] not in scope['file']:
+            return False
+    return True
+
+
+def breathe_lazy_compound_finder_filter(self, ancestors, filter_, matches):
+    # the same as 'CompoundTypeSubItemFinder.filter_', the file of a compound without the matching members
+    # is read only if something in it can match, instead of the file of every compound of the 'index.xml'
+    node_stack = stack(self.data_object, ancestors)
+
+    if filter_.allow(node_stack):
+        matches.append(node_stack)
+
+    member_matches = []
+    for member in self.data_object.get_member():
+        member_finder = self.item_finder_factory.create_finder(member)
+        member_finder.filter_(node_stack, filter_, member_matches)
+
+    if member_matches:
+        file_data = self.compound_parser.parse(self.data_object.refid)
+        finder = self.item_finder_factory.create_finder(file_data)
+        for member_stack in member_matches:
+            ref_filter = self.filter_factory.create_id_filter('memberdef', member_stack[0].refid)
+            finder.filter_(node_stack, ref_filter, matches)
+    elif breathe_compound_may_match(filter_, self.data_object):
+        file_data = self.compound_parser.parse(self.data_object.refid)
+        finder = self.item_finder_factory.create_finder(file_data)
+        finder.filter_(node_stack, filter_, matches)
+
+
+def breathe_file_state_update(app, filename):
+    # the same as 'breathe.file_state_cache.update' with the content hash instead of the modification time,
+    # doxygen writes every xml file again on every run
+    try:
+        digest = file_digest(filename)
+    except OSError:
+        raise MTimeError(f"Cannot find file: {os.path.realpath(filename)}")
+
+    if breathe_file_state_deferred is not None:
+        breathe_file_state_deferred.append(filename)
+        return
+
+    if not hasattr(app.env, 'breathe_file_hashes'):
+        app.env.breathe_file_hashes = {}
+
+    docnames = app.env.breathe_file_hashes.get(filename, (digest, set()))[1]
+    docnames.add(app.env.docname)
+    app.env.breathe_file_hashes[filename] = (digest, docnames)
+
+
+def breathe_compound_finder_filter(self, ancestors, filter_, matches):
+    global breathe_file_state_deferred
+
+    # the finders read the file of every compound of the 'index.xml' for every directive,
+    # the names and kinds they match are in the 'index.xml' itself, which every document depends on,
+    # so the file of a compound is a dependency of the document only if something in it matched
+    start = len(matches)
+    deferred = []
+    breathe_file_state_deferred = deferred
+    try:
+        if breathe_lazy_compound_files:
+            breathe_lazy_compound_finder_filter(self, ancestors, filter_, matches)
+        else:
+            breathe_old_compound_finder_filter(self, ancestors, filter_, matches)
+    finally:
+        breathe_file_state_deferred = None
+
+    if len(matches) > start:
+        for filename in deferred:
+            breathe_file_state_update(self.compound_parser.app, filename)
+
+
+def breathe_persistent_parse(kind, parse, filename):
+    if breathe_parser_cache_dir is None:
+        return parse(filename)
+
+    try:
+        digest = file_digest(filename)
+    except OSError:
+        # breathe reports the missing file
+        return parse(filename)
+
+    key = hashlib.sha256(f"{kind}:{breathe.__version__}:{digest}".encode()).hexdigest()
+    path = Path(breathe_parser_cache_dir).joinpath(key[:2], key + '.pickle.z')
+
+    if path.is_file():
+        # a lot of small objects, the collections on the way only slow the loading down
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            result = pickle.loads(zlib.decompress(path.read_bytes()))
+            # the recently used entries are kept, see 'build_finished'
+            os.utime(path)
+            breathe_parser_cache_dir_stats['hits'] += 1
+            return result
+        except Exception as e:
+            logger.warning(f"-- {inspect.currentframe().f_code.co_name} ignore '{path}': {e}")
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    breathe_parser_cache_dir_stats['misses'] += 1
+    result = parse(filename)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_write(path) as temporary_path:
+        temporary_path.write_bytes(zlib.compress(pickle.dumps(result, pickle.HIGHEST_PROTOCOL), 1))
+
+    return result
+
+
+def breathe_cached_parse(kind, parse, filename):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        # breathe reports the missing file
+        return parse(filename)
+
+    key = (kind, os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+    return lru_cache_get(breathe_parser_cache, key, lambda: breathe_persistent_parse(kind, parse, filename))
+
+
+def breathe_cached_parse_index(filename):
+    return breathe_cached_parse('index', breathe_old_parse_index, filename)
+
+
+def breathe_cached_parse_compound(filename):
+    return breathe_cached_parse('compound', breathe_old_parse_compound, filename)
+
+
+def breathe_preload_parser_cache(path):
+    index = breathe_cached_parse_index(os.path.join(path, 'index.xml'))
+    for compound in index.compound:
+        breathe_cached_parse_compound(os.path.join(path, compound.refid + '.xml'))
+    return len(index.compound)
+
+
+def breathe_filter_cache_counters():
+    return {
+        'content': [breathe_content_filter_cache['hits'], breathe_content_filter_cache['misses']],
+        'render': [breathe_render_filter_cache['hits'], breathe_render_filter_cache['misses']]
+    }
+
+
+def install(config):
+    global breathe_content_filter_cache
+    global breathe_render_filter_cache
+    global breathe_parser_cache
+    global breathe_lazy_compound_files
+
+    breathe_content_filter_cache = create_lru_cache(config.breathe_filter_cache_size)
+    breathe_render_filter_cache = create_lru_cache(config.breathe_filter_cache_size)
+
+    # the parsed files are checked by the modification time and size, so they are kept
+    if breathe_parser_cache['size'] != config.breathe_parser_cache_size:
+        breathe_parser_cache = create_lru_cache(config.breathe_parser_cache_size)
+
+    setattr(FilterFactory, 'create_content_filter', breathe_cached_create_content_filter)
+    setattr(FilterFactory, 'create_render_filter', breathe_cached_create_render_filter)
+    setattr(breathe.parser.index, 'parse', breathe_cached_parse_index if config.breathe_parser_cache_size > 0 else breathe_old_parse_index)
+    setattr(breathe.parser.compound, 'parse', breathe_cached_parse_compound if config.breathe_parser_cache_size > 0 else breathe_old_parse_compound)
+    setattr(breathe.file_state_cache, 'update', breathe_file_state_update if config.breathe_file_state_content_hash else breathe_old_file_state_update)
+    breathe_lazy_compound_files = config.breathe_lazy_compound_files
+    breathe_compound_scope['filter'] = None
+    breathe_compound_scope['scope'] = None
+
+    if config.breathe_file_state_content_hash:
+        setattr(CompoundTypeSubItemFinder, 'filter_', breathe_compound_finder_filter)
+    elif config.breathe_lazy_compound_files:
+        setattr(CompoundTypeSubItemFinder, 'filter_', breathe_lazy_compound_finder_filter)
+    else:
+        setattr(CompoundTypeSubItemFinder, 'filter_', breathe_old_compound_finder_filter)
+
+
+def config_inited(app, config):
+    global breathe_parser_cache_dir
+
+    install(config)
+
+    if not config.breathe_parser_cache_persistent:
+        breathe_parser_cache_dir = None
+    elif config.breathe_parser_cache_dir == '':
+        breathe_parser_cache_dir = str(Path(app.doctreedir).joinpath('breathe_parser_cache'))
+    else:
+        # relative to the 'conf.py' directory, the same as the 'breathe_projects'
+        breathe_parser_cache_dir = str(Path(app.confdir).joinpath(config.breathe_parser_cache_dir))
+
+
+def builder_inited(app):
+    # without the state of 'breathe.file_state_cache' its 'env-get-outdated' listener returns nothing,
+    # the documents are compared by the content hashes instead, see 'env_get_outdated'
+    if app.config.breathe_file_state_content_hash and hasattr(app.env, 'breathe_file_state'):
+        del app.env.breathe_file_state
+
+
+def env_get_outdated(app, env, added, changed, removed):
+    if not app.config.breathe_file_state_content_hash or not hasattr(env, 'breathe_file_hashes'):
+        return []
+
+    files = 0
+    outdated = set()
+    for filename, (digest, docnames) in env.breathe_file_hashes.items():
+        try:
+            if file_digest(filename) == digest:
+                continue
+        except OSError:
+            # read again, breathe reports the missing file
+            pass
+        files += 1
+        outdated.update(docnames)
+
+    outdated.difference_update(removed)
+    logger.info(f"-- {inspect.currentframe().f_code.co_name}: changed files: {files} outdated: {len(outdated)}")
+    return sorted(outdated)
+
+
+def env_before_read_docs(app, env, docnames):
+    if not hasattr(env, 'breathe_filter_cache_stats'):
+        env.breathe_filter_cache_stats = {}
+
+
+def source_read(app, docname, source):
+    breathe_filter_cache_snapshots[docname] = breathe_filter_cache_counters()
+
+    # set by the 'source-read' of breathe, the same one for every document
+    parser_factory = app.env.temp_data.get('breathe_parser_factory')
+    if parser_factory is not None and app.config.breathe_parser_cache_size > 0 and not isinstance(parser_factory.cache, BreatheParserFactoryCache):
+        parser_factory.cache = BreatheParserFactoryCache()
+
+
+def doctree_read(app, doctree):
+    docname = app.env.docname
+    start = breathe_filter_cache_snapshots.pop(docname, None)
+
+    if start is None:
+        return
+
+    end = breathe_filter_cache_counters()
+    app.env.breathe_filter_cache_stats[docname] = {
+        name: [end[name][i] - start[name][i] for i in range(2)] for name in end
+    }
+
+
+def env_purge_doc(app, env, docname):
+    if hasattr(env, 'breathe_filter_cache_stats'):
+        env.breathe_filter_cache_stats.pop(docname, None)
+
+    if hasattr(env, 'breathe_file_hashes'):
+        for filename, (digest, docnames) in list(env.breathe_file_hashes.items()):
+            docnames.discard(docname)
+            if len(docnames) == 0:
+                del env.breathe_file_hashes[filename]
+
+
+def env_merge_info(app, env, docnames, other):
+    for docname in docnames:
+        if docname in other.breathe_filter_cache_stats:
+            env.breathe_filter_cache_stats[docname] = other.breathe_filter_cache_stats[docname]
+
+    # breathe does not merge its 'breathe_file_state', the hashes of the files read by the worker are newer
+    if hasattr(other, 'breathe_file_hashes'):
+        if not hasattr(env, 'breathe_file_hashes'):
+            env.breathe_file_hashes = {}
+        for filename, (digest, docnames) in other.breathe_file_hashes.items():
+            old_docnames = env.breathe_file_hashes.get(filename, (digest, set()))[1]
+            env.breathe_file_hashes[filename] = (digest, old_docnames | docnames)
+
+
+def build_finished(app, exception):
+    stats = getattr(app.env, 'breathe_filter_cache_stats', {})
+
+    for name in ['content', 'render']:
+        hits = sum(entry[name][0] for entry in stats.values())
+        misses = sum(entry[name][1] for entry in stats.values())
+        logger.info(f"-- breathe {name} filter cache hits: '{hits}' misses: '{misses}'")
+
+    logger.info(f"-- breathe parser cache hits: '{breathe_parser_cache['hits']}' misses: '{breathe_parser_cache['misses']}'")
+
+    if breathe_parser_cache_dir is not None:
+        logger.info(f"-- breathe parser cache dir: '{breathe_parser_cache_dir}' hits: '{breathe_parser_cache_dir_stats['hits']}' misses: '{breathe_parser_cache_dir_stats['misses']}'")
+
+    # the entries are keyed by the content of the xml files, the ones of the changed files are not used any more
+    if breathe_parser_cache_dir is not None and breathe_parser_cache_dir_stats['misses'] > 0:
+        removed = prune_cache_dir(breathe_parser_cache_dir, app.config.breathe_parser_cache_dir_size, '*.pickle.z')
+        if removed > 0:
+            logger.info(f"-- breathe parser cache dir removed: '{removed}'")
+
+
+def setup(app):
+    app.add_config_value('breathe_new_create_content_filter_apply', True, 'env')
+    app.add_config_value('breathe_new_create_content_filter_log', False, '')
+    app.add_config_value('breathe_new_create_render_filter_apply', True, 'env')
+    app.add_config_value('breathe_new_create_render_filter_log', False, '')
+    app.add_config_value('breathe_filter_cache_size', 128, '')
+    app.add_config_value('breathe_parser_cache_size', 1024, '')
+    app.add_config_value('breathe_parser_cache_persistent', True, '')
+    app.add_config_value('breathe_parser_cache_dir', '', '')
+    app.add_config_value('breathe_parser_cache_dir_size', 1 << 30, '')
+    # the documents are read again if it is changed, the state of the other one is not kept
+    app.add_config_value('breathe_file_state_content_hash', True, 'env')
+    app.add_config_value('breathe_lazy_compound_files', True, '')
+    app.connect('config-inited', config_inited)
+    app.connect('builder-inited', builder_inited)
+    app.connect('env-get-outdated', env_get_outdated)
+    app.connect('env-before-read-docs', env_before_read_docs)
+    # after the 'source-read' of breathe
+    app.connect('source-read', source_read, priority=600)
+    app.connect('doctree-read', doctree_read)
+    app.connect('env-purge-doc', env_purge_doc)
+    app.connect('env-merge-info', env_merge_info)
+    app.connect('build-finished', build_finished)
@@ -0,0 +1,68 @@
+import pickle
+import inspect
+
+import sphinx.util
+from sphinx.environment import CONFIG_OK
+
+logger = sphinx.util.logging.getLogger(__name__)
+
+# builders and the extensions registering them, loaded only if the builder is used
+builder_extensions = {
+    'pdf': 'rst2pdf.pdfbuilder'
+}
+
+# per-process state, the pickled environment read and resolved by another process, written instead of read again
+builders_resolved_env = None
+# per-process state, the environment of the previous build kept in memory, updated instead of loaded again,
+# the application is created with 'freshenv', see 'exqudens_sphinx.watch'
+builders_warm_env = None
+
+
+def load_builder_extension(app, name):
+    if name not in builder_extensions or name in app.registry.builders:
+        return
+
+    logger.info(f"-- {inspect.currentframe().f_code.co_name}: '{builder_extensions[name]}'")
+    app.setup_extension(builder_extensions[name])
+
+
+def builder_inited(app):
+    if builders_warm_env is not None:
+        logger.info(f"-- {inspect.currentframe().f_code.co_name}: warm environment")
+
+        env = builders_warm_env
+        # the configuration is compared with the one of the previous build, the same as for a loaded environment
+        env.setup(app)
+        env.set_versioning_method(app.builder.versioning_method, app.builder.versioning_compare)
+        app.env = env
+        app.builder.env = env
+        return
+
+    if builders_resolved_env is None:
+        return
+
+    logger.info(f"-- {inspect.currentframe().f_code.co_name}: resolved environment")
+
+    env = pickle.loads(builders_resolved_env)
+    env.setup(app)
+    # the other process read the same configuration, the values differing between the processes are ignored
+    env.config_status = CONFIG_OK
+    env.config_status_extra = ''
+    env.set_versioning_method(app.builder.versioning_method, app.builder.versioning_compare)
+    app.env = env
+    app.builder.env = env
+
+
+def setup(app):
+    # sphinx preloads the builder after the extensions are set up and before the
+    # configuration values are initialized, so the values of the loaded extension are set from 'conf.py'
+    preload_builder = app.preload_builder
+
+    def lazy_preload_builder(name):
+        load_builder_extension(app, name)
+        preload_builder(name)
+
+    app.preload_builder = lazy_preload_builder
+
+    # after the 'builder-inited' of the other extensions, which initialize the environment being replaced
+    app.connect('builder-inited', builder_inited, priority=800)
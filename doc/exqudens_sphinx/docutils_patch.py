@@ -0,0 +1,120 @@
+import inspect
+from collections import deque
+
+import sphinx.util
+import docutils.nodes
+from docutils.nodes import NodeVisitor
+from docutils.nodes import TreePruningException
+
+from .util import to_node_string
+
+logger = sphinx.util.logging.getLogger(__name__)
+
+modes = ['off', 'cheap', 'full']
+
+docutils_old_walkabout = docutils.nodes.document.walkabout
+docutils_old_dispatch_visit = NodeVisitor.dispatch_visit
+docutils_old_dispatch_departure = NodeVisitor.dispatch_departure
+
+# per-process state, every worker process of a parallel build has its own
+docutils_text_visited_nodes_size = 10
+docutils_text_visited_nodes = deque([], docutils_text_visited_nodes_size)
+
+
+def find_failed_node(traceback):
+    node = None
+    walkabout_code = docutils.nodes.Node.walkabout.__code__
+    while traceback is not None:
+        if traceback.tb_frame.f_code is walkabout_code:
+            node = traceback.tb_frame.f_locals.get('self')
+        traceback = traceback.tb_next
+    return node
+
+
+def find_previous_nodes(root, node, class_names=None, size=None):
+    if class_names is None:
+        raise Exception("Unspecified 'class_names'")
+
+    result = deque([], size)
+
+    for n in root.traverse():
+        if n is node:
+            break
+        if n.__class__.__name__ in class_names:
+            result.append(n)
+
+    return result
+
+
+# nothing is recorded per node: the failed node is taken from the
+# traceback and the previous text nodes are collected only on failure
+def docutils_new_walkabout(self, visitor):
+    try:
+        return docutils_old_walkabout(self, visitor)
+    except TreePruningException as e:
+        raise e
+    except Exception as e:
+        node = find_failed_node(e.__traceback__)
+        if node is not None:
+            previous_nodes = find_previous_nodes(self, node, class_names=['Text'], size=docutils_text_visited_nodes_size)
+            for n in previous_nodes:
+                logger.error(f"-- {inspect.currentframe().f_code.co_name} (previous): {to_node_string(n)}")
+            logger.error(f"-- {inspect.currentframe().f_code.co_name} (current): {to_node_string(node)}")
+        logger.error(e, exc_info = True)
+        raise e
+
+
+def docutils_new_dispatch_visit(self, node):
+    try:
+        if node is not None and node.__class__.__name__ == 'Text':
+            docutils_text_visited_nodes.append(node)
+        return docutils_old_dispatch_visit(self, node)
+    except TreePruningException as e:
+        raise e
+    except Exception as e:
+        for n in docutils_text_visited_nodes:
+            logger.error(f"-- {inspect.currentframe().f_code.co_name} (previous): {to_node_string(n)}")
+        logger.error(f"-- {inspect.currentframe().f_code.co_name} (current): {to_node_string(node)}")
+        logger.error(e, exc_info = True)
+        raise e
+
+
+def docutils_new_dispatch_departure(self, node):
+    try:
+        return docutils_old_dispatch_departure(self, node)
+    except TreePruningException as e:
+        raise e
+    except Exception as e:
+        for n in docutils_text_visited_nodes:
+            logger.error(f"-- {inspect.currentframe().f_code.co_name} (previous): '{to_node_string(n)}'")
+        logger.error(f"-- {inspect.currentframe().f_code.co_name} (current): {to_node_string(node)}")
+        logger.error(e, exc_info = True)
+        raise e
+
+
+def install(config):
+    global docutils_text_visited_nodes_size
+    global docutils_text_visited_nodes
+
+    mode = config.docutils_dispatch_diagnostics
+
+    if mode not in modes:
+        raise Exception(f"Unsupported 'docutils_dispatch_diagnostics': '{mode}'")
+
+    docutils_text_visited_nodes_size = config.docutils_text_visited_nodes_size
+    docutils_text_visited_nodes = deque([], docutils_text_visited_nodes_size)
+
+    # installing is idempotent, the originals are restored for the parts the mode does not patch
+    setattr(docutils.nodes.document, 'walkabout', docutils_new_walkabout if mode == 'cheap' else docutils_old_walkabout)
+    setattr(NodeVisitor, 'dispatch_visit', docutils_new_dispatch_visit if mode == 'full' else docutils_old_dispatch_visit)
+    setattr(NodeVisitor, 'dispatch_departure', docutils_new_dispatch_departure if mode == 'full' else docutils_old_dispatch_departure)
+
+
+def config_inited(app, config):
+    install(config)
+
+
+def setup(app):
+    app.add_config_value('docutils_text_visited_nodes_size', 10, '')
+    app.add_config_value('docutils_dispatch_diagnostics', 'cheap', '')
+    app.connect('config-inited', config_inited)
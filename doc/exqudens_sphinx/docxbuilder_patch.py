@@ -0,0 +1,615 @@
+import os
+import json
+import time
+import types
+import pickle
+import struct
+import hashlib
+import inspect
+import zipfile
+import importlib
+from pathlib import Path
+from datetime import datetime
+from datetime import timezone
+
+import sphinx.util
+import docutils.nodes
+from sphinx import addnodes
+from sphinx.util.docutils import new_document
+from sphinx.util.docutils import LoggingReporter
+from sphinx.util.osutil import ensuredir
+from docutils.io import NullOutput
+from docxbuilder import DocxBuilder
+from docxbuilder.writer import DocxTranslator
+
+from . import fixups
+from .util import log_node
+from .util import freeze
+from .util import atomic_write
+
+logger = sphinx.util.logging.getLogger(__name__)
+
+docxbuilder_old_assemble_doctree = DocxBuilder.assemble_doctree
+docxbuilder_old_write_doc = DocxBuilder.write_doc
+docxbuilder_old_visit_start_of_file = DocxTranslator.visit_start_of_file
+docxbuilder_old_depart_start_of_file = DocxTranslator.depart_start_of_file
+
+# the module writing the docx file, its 'zipfile' is replaced while the document is written, see 'docxbuilder_zip_module'
+docxbuilder_docx_module = importlib.import_module('docxbuilder.docx.docx')
+
+docxbuilder_output_hashes_file_name = 'docxbuilder_output_hashes.json'
+# part of the key of every assembled document, changed with the way the documents are assembled or stored
+docxbuilder_assemble_doctree_cache_version = 1
+docxbuilder_assemble_doctree_cache_dir_name = 'docxbuilder_assemble_doctree_cache'
+# one file for all documents, written by the previous versions, removed after writing
+docxbuilder_assemble_doctree_cache_old_file_name = 'docxbuilder_assemble_doctree_cache.pickle'
+# the header of a cache file: the key of the document, the offset and the length of its pickled tree,
+# the chunks of the tree are before it, see 'docxbuilder_split_node'
+docxbuilder_assemble_doctree_cache_header = struct.Struct('<64sQQ')
+
+# per-process state, the context of the chunked assembly of the document being written, 'None' if not chunked
+docxbuilder_chunk_context = None
+
+# documents with these nodes render the contents of the traceability items
+# of the other documents, so they are not cached
+docxbuilder_assemble_doctree_cache_volatile = [
+    {
+        'nodes': ['ItemList'],
+        'condition': {'showcontents': True}
+    }
+]
+
+# the nodes of the included documents split by the chunked assembly, their other children are fixed, stored and
+# written one at a time, see 'DocxbuilderChunk', the translator of these nodes does not look at their children
+docxbuilder_assemble_doctree_chunk_nodes = ['section', 'desc', 'desc_content']
+# the attributes of a split document referencing its nodes, not used by the translator, emptied before the split,
+# otherwise the stored nodes are kept in memory and pickled again with the document
+docxbuilder_assemble_doctree_chunk_document_indexes = [
+    'ids', 'refnames', 'refids', 'nameids', 'nametypes', 'indirect_targets', 'substitution_defs', 'substitution_names',
+    'footnote_refs', 'citation_refs', 'autofootnotes', 'autofootnote_refs', 'symbol_footnotes', 'symbol_footnote_refs',
+    'footnotes', 'citations'
+]
+
+
+class DocxbuilderChunk(docutils.nodes.Element):
+    # the child of a split node, stored in the cache file of its document and loaded only while it is written,
+    # in place of the chunk, so the written node has the same parent and index
+
+    def walkabout(self, visitor):
+        parent = self.parent
+        index = self['index']
+        if index >= len(parent.children) or parent.children[index] is not self:
+            index = parent.index(self)
+
+        node = docxbuilder_load_chunk(self)
+        parent.children[index] = node
+        node.parent = parent
+        try:
+            # the toctrees of the chunk are expanded as it is written, the same as the ones of a document
+            context = docxbuilder_chunk_context
+            docxbuilder_expand_toctrees(context['builder'], node, context['traversed'], self['scoped'], context)
+            return node.walkabout(visitor)
+        finally:
+            # the written node is released
+            parent.children[index] = self
+
+
+def docxbuilder_dumps_doctree(tree):
+    env = tree.settings.env
+    reporter = tree.reporter
+    try:
+        tree.settings.env = None
+        tree.reporter = None
+        return pickle.dumps(tree, pickle.HIGHEST_PROTOCOL)
+    finally:
+        tree.settings.env = env
+        tree.reporter = reporter
+
+
+def docxbuilder_loads_doctree(env, docname, value):
+    tree = pickle.loads(value)
+    tree.settings.env = env
+    tree.reporter = LoggingReporter(env.doc2path(docname))
+    return tree
+
+
+def docxbuilder_resolve_fingerprint(env):
+    # everything the post transforms of a document can take from the other documents,
+    # the contents of the traceability items are left out, see 'docxbuilder_assemble_doctree_cache_volatile'
+    data = {
+        'objects': {domain.name: sorted(map(repr, domain.get_objects())) for domain in env.domains.values()},
+        'titles': {docname: title.astext() for docname, title in env.titles.items()},
+        'secnumbers': env.toc_secnumbers,
+        'fignumbers': env.toc_fignumbers
+    }
+
+    collection = getattr(env, 'traceability_collection', None)
+    if collection is not None:
+        data['relations'] = collection.relations
+        data['items'] = {
+            item_id: {
+                k: v for k, v in item.to_dict().items() if k not in ['line', 'content-hash']
+            } for item_id, item in collection.items.items()
+        }
+
+    return hashlib.sha256(repr(freeze(data)).encode()).digest()
+
+
+def docxbuilder_config_fingerprint(app):
+    # the configuration values the documents are read and resolved with, and the versions of the extensions
+    # resolving them, the functions by name, their representation changes with every process
+    values = {
+        item.name: f"{item.value.__module__}.{item.value.__qualname__}" if callable(item.value) else item.value
+        for item in app.config.filter('env')
+    }
+    data = {
+        'version': docxbuilder_assemble_doctree_cache_version,
+        'config': values,
+        'extensions': {name: extension.version for name, extension in app.extensions.items()}
+    }
+
+    return hashlib.sha256(repr(freeze(data)).encode()).digest()
+
+
+def docxbuilder_is_volatile(tree, rules):
+    for node in tree.traverse(docutils.nodes.Element):
+        for rule in rules:
+            if node.__class__.__name__ not in rule['nodes']:
+                continue
+            if all(node.get(key) == expected for key, expected in rule.get('condition', {}).items()):
+                return True
+    return False
+
+
+def docxbuilder_assemble_doctree_cache_path(context, docname):
+    return context['path'].joinpath(docname + '.pickle')
+
+
+def docxbuilder_read_assemble_doctree_cache(context, docname, key):
+    # only the header is read, unless the key is the same
+    header = docxbuilder_assemble_doctree_cache_header
+    try:
+        with open(docxbuilder_assemble_doctree_cache_path(context, docname), 'rb') as f:
+            data = f.read(header.size)
+            if len(data) != header.size:
+                return None
+            stored_key, offset, length = header.unpack(data)
+            if stored_key != key.encode():
+                return None
+            f.seek(offset)
+            return f.read(length)
+    except OSError:
+        return None
+
+
+def docxbuilder_write_assemble_doctree_cache(self, context, docname, key, tree, scoped, split):
+    header = docxbuilder_assemble_doctree_cache_header
+    path = docxbuilder_assemble_doctree_cache_path(context, docname)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # replaced before the chunks are loaded from it
+    with atomic_write(path) as temporary_path, open(temporary_path, 'wb') as output:
+        output.write(header.pack(b'', 0, 0))
+        if split:
+            for name in docxbuilder_assemble_doctree_chunk_document_indexes:
+                setattr(tree, name, type(getattr(tree, name))())
+            docxbuilder_split_node(tree, scoped, context, output, docname, scoped)
+        data = docxbuilder_dumps_doctree(tree)
+        offset = output.tell()
+        output.write(data)
+        output.seek(0)
+        output.write(header.pack(key.encode(), offset, len(data)))
+
+
+def docxbuilder_store_chunk(node, output, docname, index, scoped):
+    # without the references to the document and the parent, the stored node is released by the caller
+    node.parent = None
+    for n in node.traverse():
+        n._document = None
+    data = pickle.dumps(node, pickle.HIGHEST_PROTOCOL)
+    offset = output.tell()
+    output.write(data)
+    return DocxbuilderChunk(docname=docname, offset=offset, length=len(data), index=index, scoped=scoped)
+
+
+def docxbuilder_load_chunk(chunk):
+    with open(docxbuilder_assemble_doctree_cache_path(docxbuilder_chunk_context, chunk['docname']), 'rb') as f:
+        f.seek(chunk['offset'])
+        data = f.read(chunk['length'])
+    docxbuilder_chunk_context['chunks'] += 1
+    return pickle.loads(data)
+
+
+def docxbuilder_split_node(node, scoped, context, output, docname, document_scoped):
+    # the same order as 'fixups.fixups_fix_node', the children are fixed before the node, then stored one at a time,
+    # the rules of a node change only its children, so the children of the split children are stored first
+    index = 0
+    while index < len(node.children):
+        child = node.children[index]
+        siblings = len(node.children)
+        if isinstance(child, docutils.nodes.Element):
+            child_scoped = scoped or child.__class__.__name__ in context['scope']
+            if child.__class__.__name__ in context['chunk_nodes']:
+                docxbuilder_split_node(child, child_scoped, context, output, docname, document_scoped)
+            else:
+                fixups.fixups_fix_node(
+                    child,
+                    include_self=True,
+                    scope=context['scope'],
+                    dispatch=context['dispatch'],
+                    scoped=child_scoped
+                )
+        # the siblings inserted after the child by its rules are already fixed
+        index += 1 + len(node.children) - siblings
+
+    # the rules of the document itself are not applied, the same as with 'include_self=False'
+    if not isinstance(node, docutils.nodes.document):
+        fixups.fixups_apply_rules(node, scoped, context['dispatch'])
+
+    for index, child in enumerate(node.children):
+        if not isinstance(child, docutils.nodes.Element) or child.__class__.__name__ in context['chunk_nodes']:
+            continue
+        chunk = docxbuilder_store_chunk(child, output, docname, index, document_scoped)
+        node.children[index] = chunk
+        chunk.parent = node
+        context['stored'] += 1
+
+
+def docxbuilder_assemble_document(self, docname, traversed, scoped, context, tree=None):
+    key = None
+    data = None
+
+    # the key is the stored doctree of the document, not the resolved one,
+    # so a cached document is neither loaded, nor resolved, nor fixed
+    if tree is None:
+        key = hashlib.sha256(
+            Path(self.doctreedir).joinpath(docname + '.doctree').read_bytes()
+            + context['key']
+            + (b'1' if scoped else b'0')
+        ).hexdigest()
+        data = docxbuilder_read_assemble_doctree_cache(context, docname, key)
+
+    if data is not None:
+        try:
+            tree = docxbuilder_loads_doctree(self.env, docname, data)
+            context['hits'] += 1
+        except Exception as e:
+            logger.warning(f"-- {inspect.currentframe().f_code.co_name} ignore '{docname}': {e}")
+        data = None
+
+    if tree is None or key is None:
+        if tree is None:
+            tree = self.env.get_doctree(docname)
+        volatile = docxbuilder_is_volatile(tree, context['volatile'])
+        # resolved with its own docname, the same as by 'docxbuilder.builder.insert_all_toctrees',
+        # the handlers of 'doctree-resolved' make the references relative to it, see 'test_docxbuilder_patch'
+        self.env.apply_post_transforms(tree, docname)
+        # a stored document is split into chunks as it is fixed, see 'docxbuilder_split_node'
+        split = key is not None and not volatile and context['chunked']
+        if not split:
+            fixups.fixups_fix_node(
+                tree,
+                include_self=False,
+                scope=context['scope'],
+                dispatch=context['dispatch'],
+                scoped=scoped
+            )
+        if key is not None:
+            context['misses'] += 1
+            if volatile:
+                docxbuilder_assemble_doctree_cache_path(context, docname).unlink(missing_ok=True)
+            else:
+                docxbuilder_write_assemble_doctree_cache(self, context, docname, key, tree, scoped, split)
+
+    docxbuilder_expand_toctrees(self, tree, traversed, scoped, context)
+
+    return tree
+
+
+def docxbuilder_expand_toctrees(self, tree, traversed, scoped, context):
+    # same as 'docxbuilder.builder.insert_all_toctrees' for the already fixed document,
+    # numbered instead of 'id(toctreenode)', the bookmark names of the docx file are made from the ids
+    for toctreenode in list(tree.traverse(addnodes.toctree)):
+        nodeid = 'docx_expanded_toctree%d' % context['toctrees']
+        context['toctrees'] += 1
+        newnodes = docutils.nodes.container(ids=[nodeid])
+        toctreenode['docx_expanded_toctree_refid'] = nodeid
+        parent = toctreenode.parent
+        parent_scoped = scoped or fixups.fixups_is_scoped(parent, context['scope'])
+        for includefile in toctreenode['includefiles']:
+            if context['chunked']:
+                # assembled as it is written, see 'docxbuilder_chunked_visit_start_of_file'
+                newnodes.append(addnodes.start_of_file(docname=includefile, docxbuilder_chunk=True, docxbuilder_chunk_scoped=parent_scoped))
+                continue
+            if includefile in traversed:
+                continue
+            try:
+                traversed.append(includefile)
+                subtree = docxbuilder_assemble_document(
+                    self,
+                    includefile,
+                    traversed,
+                    parent_scoped,
+                    context
+                )
+            except Exception: # pylint: disable=broad-except
+                continue
+            start_of_file = addnodes.start_of_file(docname=includefile)
+            start_of_file.children = subtree.children
+            newnodes.append(start_of_file)
+        index = parent.index(toctreenode)
+        parent.insert(index + 1, newnodes)
+
+
+def docxbuilder_cached_assemble_doctree(self, master, toctree_only):
+    global docxbuilder_chunk_context
+
+    config = self.config
+    context = {
+        'builder': self,
+        'scope': config.docxbuilder_fix_node_scope,
+        'dispatch': fixups.fixups_create_dispatch(config.docxbuilder_fix_node_rules),
+        'volatile': config.docxbuilder_assemble_doctree_cache_volatile,
+        'chunked': config.docxbuilder_assemble_doctree_chunked,
+        'chunk_nodes': config.docxbuilder_assemble_doctree_chunk_nodes,
+        'key': docxbuilder_resolve_fingerprint(self.env) + docxbuilder_config_fingerprint(self.app) + repr((
+            config.docxbuilder_fix_node_scope,
+            config.docxbuilder_fix_node_rules,
+            config.docxbuilder_assemble_doctree_chunked,
+            config.docxbuilder_assemble_doctree_chunk_nodes
+        )).encode(),
+        # one file per document, only the key of the document is read before it is assembled
+        'path': Path(self.doctreedir).joinpath(docxbuilder_assemble_doctree_cache_dir_name),
+        'traversed': [],
+        'toctrees': 0,
+        'documents': 0,
+        'chunks': 0,
+        'stored': 0,
+        'hits': 0,
+        'misses': 0
+    }
+
+    docxbuilder_chunk_context = None
+    tree = self.env.get_doctree(master)
+    if toctree_only:
+        doc = new_document('docxbuilder/builder.py')
+        for toctree in tree.traverse(addnodes.toctree):
+            # ids is not assigned to toctree, but to the parent
+            toctree.get('ids').extend(toctree.parent.get('ids'))
+            doc.append(toctree)
+        doc.settings.env = self.env
+        tree = doc
+    # the master document is always processed, it is not cached
+    tree = docxbuilder_assemble_document(self, master, context['traversed'], False, context, tree=tree)
+    tree['docname'] = master
+
+    if context['chunked']:
+        # the included documents are not assembled yet, see 'docxbuilder_new_write_doc'
+        docxbuilder_chunk_context = context
+    else:
+        docxbuilder_finish_assemble_doctree_cache(self, context)
+
+    return tree
+
+
+def docxbuilder_finish_assemble_doctree_cache(self, context):
+    if self.config.docxbuilder_new_assemble_doctree_log:
+        logger.info(f"-- {inspect.currentframe().f_code.co_name} cache hits: '{context['hits']}' misses: '{context['misses']}' documents: '{context['documents']}' chunks stored: '{context['stored']}' written: '{context['chunks']}'")
+
+    Path(self.doctreedir).joinpath(docxbuilder_assemble_doctree_cache_old_file_name).unlink(missing_ok=True)
+
+    if context['misses'] == 0 or not context['path'].is_dir():
+        return
+
+    # the files of the removed documents
+    for path in context['path'].rglob('*.pickle'):
+        if path.relative_to(context['path']).as_posix()[:-len('.pickle')] not in self.env.all_docs:
+            path.unlink()
+
+
+def docxbuilder_chunked_visit_start_of_file(self, node):
+    # the included document is assembled, fixed and written one at a time, the same as in 'docxbuilder_assemble_document',
+    # in the order of writing, which is the order of the assembly
+    if docxbuilder_chunk_context is None or not node.get('docxbuilder_chunk', False):
+        return docxbuilder_old_visit_start_of_file(self, node)
+
+    context = docxbuilder_chunk_context
+    includefile = node['docname']
+
+    if includefile in context['traversed']:
+        raise docutils.nodes.SkipNode
+    try:
+        context['traversed'].append(includefile)
+        subtree = docxbuilder_assemble_document(
+            self._builder,
+            includefile,
+            context['traversed'],
+            node['docxbuilder_chunk_scoped'],
+            context
+        )
+    except Exception: # pylint: disable=broad-except
+        raise docutils.nodes.SkipNode
+
+    context['documents'] += 1
+    node.children = subtree.children
+    return docxbuilder_old_visit_start_of_file(self, node)
+
+
+def docxbuilder_chunked_depart_start_of_file(self, node):
+    docxbuilder_old_depart_start_of_file(self, node)
+
+    # the written document is released
+    if node.get('docxbuilder_chunk', False):
+        node.children = []
+
+
+def docxbuilder_new_assemble_doctree(self, master, toctree_only):
+    if self.config.docxbuilder_new_assemble_doctree_log:
+        logger.info(f"-- {inspect.currentframe().f_code.co_name}")
+
+    if (
+            self.config.docxbuilder_new_assemble_doctree_apply
+            and self.config.docxbuilder_assemble_doctree_cache
+            and not self.config.docxbuilder_new_assemble_doctree_log_node_before
+    ):
+        if self.config.docxbuilder_new_assemble_doctree_log:
+            logger.info(f"-- {inspect.currentframe().f_code.co_name} process cached")
+
+        tree = docxbuilder_cached_assemble_doctree(self, master, toctree_only)
+    else:
+        tree = docxbuilder_old_assemble_doctree(self, master, toctree_only)
+
+        if self.config.docxbuilder_new_assemble_doctree_log and self.config.docxbuilder_new_assemble_doctree_log_node_before:
+            logger.info(f"-- {inspect.currentframe().f_code.co_name} log node before")
+            log_node(tree, **self.config.docxbuilder_new_assemble_doctree_log_node_options)
+
+        if not self.config.docxbuilder_new_assemble_doctree_apply:
+            return tree
+
+        if self.config.docxbuilder_new_assemble_doctree_log:
+            logger.info(f"-- {inspect.currentframe().f_code.co_name} process")
+
+        tree = fixups.fixups_fix_node(
+            tree,
+            include_self=False,
+            scope=self.config.docxbuilder_fix_node_scope,
+            dispatch=fixups.fixups_create_dispatch(self.config.docxbuilder_fix_node_rules)
+        )
+
+    if self.config.docxbuilder_new_assemble_doctree_log and self.config.docxbuilder_new_assemble_doctree_log_node_after:
+        logger.info(f"-- {inspect.currentframe().f_code.co_name} log node after")
+        log_node(tree, **self.config.docxbuilder_new_assemble_doctree_log_node_options)
+
+    return tree
+
+
+def docxbuilder_source_date_epoch(config):
+    # 'None' if the output is not reproducible
+    value = config.docxbuilder_source_date_epoch
+    if value is None:
+        value = os.environ.get('SOURCE_DATE_EPOCH')
+    return None if value is None or str(value) == '' else int(value)
+
+
+class DocxbuilderZipEntries:
+    # the entries written to the docx file, collected instead of compressed
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def writestr(self, name, data):
+        self.entries.append((name, data if isinstance(data, bytes) else data.encode()))
+
+    def write(self, filename, arcname):
+        self.entries.append((arcname, Path(filename).read_bytes()))
+
+
+def docxbuilder_zip_module(entries):
+    # 'zipfile' of 'docxbuilder.docx.docx' while the document is written, the style file is read as usual
+    def zip_file(file, mode='r', **kwargs):
+        return DocxbuilderZipEntries(entries) if mode == 'w' else zipfile.ZipFile(file, mode, **kwargs)
+
+    return types.SimpleNamespace(ZipFile=zip_file, ZIP_DEFLATED=zipfile.ZIP_DEFLATED)
+
+
+def docxbuilder_write_zip(path, entries, epoch):
+    # '[Content_Types].xml' first, the other entries by name, all with the same time
+    date_time = time.gmtime(max(epoch, 315532800))[:6]
+    with atomic_write(path) as temporary_path, zipfile.ZipFile(temporary_path, mode='w', compression=zipfile.ZIP_DEFLATED) as out:
+        for name, data in sorted(entries, key=lambda entry: (entry[0] != '[Content_Types].xml', entry[0])):
+            info = zipfile.ZipInfo(name, date_time)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.create_system = 0
+            info.external_attr = 0o644 << 16
+            out.writestr(info, data)
+
+
+def docxbuilder_new_write_doc(self, docname, doctree):
+    global docxbuilder_chunk_context
+
+    try:
+        docxbuilder_write_doc(self, docname, doctree)
+    finally:
+        if docxbuilder_chunk_context is not None:
+            docxbuilder_finish_assemble_doctree_cache(self, docxbuilder_chunk_context)
+            docxbuilder_chunk_context = None
+
+
+def docxbuilder_write_doc(self, docname, doctree):
+    epoch = docxbuilder_source_date_epoch(self.config)
+
+    # 'created' is set here instead of in 'docx_documents', a changed configuration reads every document again,
+    # the same string as the one set in 'docx_documents' before
+    if 'created' not in self.doc_properties:
+        created = datetime.now() if epoch is None else datetime.fromtimestamp(epoch, timezone.utc)
+        self.doc_properties = dict(self.doc_properties, created=created.strftime('%Y-%m-%dT%H:%M:%S'))
+
+    if epoch is None:
+        return docxbuilder_old_write_doc(self, docname, doctree)
+
+    path = Path(self.outdir).joinpath(docname)
+    ensuredir(str(path.parent))
+
+    entries = []
+    setattr(docxbuilder_docx_module, 'zipfile', docxbuilder_zip_module(entries))
+    try:
+        self.writer.write(doctree, NullOutput())
+    finally:
+        setattr(docxbuilder_docx_module, 'zipfile', zipfile)
+
+    digest = hashlib.sha256()
+    for name, data in sorted(entries):
+        digest.update(f"{name}:{len(data)}:".encode())
+        digest.update(data)
+    digest = f"{epoch}:{digest.hexdigest()}"
+
+    # the output is not written again if its content and the file written last time are the same
+    hashes_path = Path(self.doctreedir).joinpath(docxbuilder_output_hashes_file_name)
+    hashes = json.loads(hashes_path.read_text()) if hashes_path.is_file() else {}
+    previous = hashes.get(str(path))
+    if previous is not None and path.is_file():
+        stat = path.stat()
+        if previous == {'digest': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}:
+            logger.info(f"-- {inspect.currentframe().f_code.co_name} unchanged: '{path}'")
+            return
+
+    docxbuilder_write_zip(path, entries, epoch)
+    stat = path.stat()
+    hashes[str(path)] = {'digest': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    hashes_path.write_text(json.dumps(hashes, indent=4))
+
+
+def install(config, apply=True):
+    setattr(DocxBuilder, 'assemble_doctree', docxbuilder_new_assemble_doctree if apply else docxbuilder_old_assemble_doctree)
+    setattr(DocxBuilder, 'write_doc', docxbuilder_new_write_doc if apply else docxbuilder_old_write_doc)
+    setattr(DocxTranslator, 'visit_start_of_file', docxbuilder_chunked_visit_start_of_file if apply else docxbuilder_old_visit_start_of_file)
+    setattr(DocxTranslator, 'depart_start_of_file', docxbuilder_chunked_depart_start_of_file if apply else docxbuilder_old_depart_start_of_file)
+
+
+def builder_inited(app):
+    # only the docx builds are patched
+    install(app.config, isinstance(app.builder, DocxBuilder))
+
+
+def setup(app):
+    app.add_config_value('docxbuilder_new_assemble_doctree_apply', True, '')
+    app.add_config_value('docxbuilder_new_assemble_doctree_log', False, '')
+    app.add_config_value('docxbuilder_new_assemble_doctree_log_node_before', False, '')
+    app.add_config_value('docxbuilder_new_assemble_doctree_log_node_after', False, '')
+    app.add_config_value('docxbuilder_new_assemble_doctree_log_node_options', {}, '')
+    app.add_config_value('docxbuilder_fix_node_scope', fixups.fixups_scope, '')
+    app.add_config_value('docxbuilder_fix_node_rules', fixups.fixups_rules, '')
+    app.add_config_value('docxbuilder_assemble_doctree_cache', True, '')
+    app.add_config_value('docxbuilder_assemble_doctree_cache_volatile', docxbuilder_assemble_doctree_cache_volatile, '')
+    # the included documents are assembled as they are written instead of in one tree, see 'docxbuilder_chunked_visit_start_of_file'
+    app.add_config_value('docxbuilder_assemble_doctree_chunked', False, '')
+    app.add_config_value('docxbuilder_assemble_doctree_chunk_nodes', docxbuilder_assemble_doctree_chunk_nodes, '')
+    # reproducible output if set, otherwise from the 'SOURCE_DATE_EPOCH' environment variable
+    app.add_config_value('docxbuilder_source_date_epoch', None, '')
+    app.connect('builder-inited', builder_inited)
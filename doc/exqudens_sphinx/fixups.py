@@ -0,0 +1,270 @@
+import docutils.nodes
+
+# the fixups of the assembled doctree, the same for every builder writing one document,
+# see 'docxbuilder_patch' and 'rst2pdf_patch', every builder has its own scope and rules
+
+fixups_scope = ['section', 'desc_content']
+fixups_rules = [
+    {
+        'nodes': ['section', 'desc_content', 'list_item', 'definition', 'note'],
+        'action': 'unwrap',
+        'children': [
+            'paragraph',
+            'bullet_list',
+            'enumerated_list',
+            'definition_list',
+            'table',
+            'seealso',
+            'desc',
+            'math_block',
+            'literal_block',
+            'image'
+        ]
+    },
+    {
+        'nodes': ['enumerated_list'],
+        'action': 'update',
+        'attributes': {'enumtype': 'arabic', 'prefix': '', 'suffix': '.', 'start': 1}
+    },
+    {
+        'nodes': ['container'],
+        'action': 'wrap',
+        'children': ['emphasis']
+    },
+    {
+        'nodes': ['colspec'],
+        'action': 'update',
+        'condition': {'colwidth': 'auto'},
+        'attributes': {'colwidth': 10000},
+        'scoped': False
+    },
+    {
+        'nodes': ['table'],
+        'action': 'table',
+        'rows': 200,
+        'sample': 100,
+        'chunk': 1000,
+        'scoped': False
+    }
+]
+
+
+def fixups_unwrap(value, class_names=None):
+    if class_names is None:
+        raise Exception("Unspecified 'class_names'")
+
+    value_nodes = []
+
+    for node in value:
+        value_nodes.append(node)
+
+    result = value
+    result.clear()
+
+    for node in value_nodes:
+        if node.__class__.__name__ == 'paragraph':
+            paragraph = docutils.nodes.paragraph()
+            for n in node:
+                if n.__class__.__name__ in class_names:
+                    if len(paragraph) > 0:
+                        result.append(paragraph)
+                        paragraph = docutils.nodes.paragraph()
+                    result.append(n)
+                else:
+                    paragraph.append(n)
+            if len(paragraph) > 0:
+                result.append(paragraph)
+        else:
+            result.append(node)
+
+    return result
+
+
+def fixups_wrap(value, class_names=None):
+    if class_names is None:
+        raise Exception("Unspecified 'class_names'")
+
+    for child_index, child in enumerate(value):
+        if child.__class__.__name__ in class_names:
+            paragraph = docutils.nodes.paragraph()
+            paragraph.append(child)
+            value[child_index] = paragraph
+
+    return value
+
+
+def fixups_update(value, attributes=None):
+    if attributes is None:
+        raise Exception("Unspecified 'attributes'")
+
+    for key, attribute in attributes.items():
+        value[key] = attribute
+
+    return value
+
+
+def fixups_table_widths(colspecs, head_rows, rows, sample):
+    # the average text length of every column in the sampled rows, at least the length of its head,
+    # the rows with spanned cells are skipped, as their columns are unknown
+    step = max(1, len(rows) // sample)
+    lengths = [0] * len(colspecs)
+    minimums = [4] * len(colspecs)
+    count = 0
+
+    for row in head_rows + rows[::step]:
+        if len(row) != len(colspecs) or any(entry.get('morerows', 0) or entry.get('morecols', 0) for entry in row):
+            continue
+        for index, entry in enumerate(row):
+            length = min(len(entry.astext()), 200)
+            if row.parent.__class__.__name__ == 'thead':
+                minimums[index] = max(minimums[index], length)
+            else:
+                lengths[index] += length
+        count += row.parent.__class__.__name__ == 'tbody'
+
+    if count == 0:
+        return
+
+    for index, colspec in enumerate(colspecs):
+        colspec['colwidth'] = max(minimums[index], round(lengths[index] / count))
+
+
+def fixups_table_split(tbody, chunk):
+    # the rows are split where no cell spans over the split
+    result = []
+    rows = tbody.children
+    start = 0
+    spanned = 0
+
+    for index, row in enumerate(rows):
+        if index - start >= chunk and spanned < index:
+            result.append(rows[start:index])
+            start = index
+        for entry in row:
+            spanned = max(spanned, index + entry.get('morerows', 0))
+
+    result.append(rows[start:])
+    return result
+
+
+def fixups_table(value, rows=None, sample=None, chunk=None):
+    if rows is None or sample is None or chunk is None:
+        raise Exception("Unspecified 'rows' or 'sample' or 'chunk'")
+
+    tgroups = [child for child in value if isinstance(child, docutils.nodes.tgroup)]
+    if len(tgroups) != 1:
+        return value
+
+    tgroup = tgroups[0]
+    colspecs = [child for child in tgroup if isinstance(child, docutils.nodes.colspec)]
+    thead = next((child for child in tgroup if isinstance(child, docutils.nodes.thead)), None)
+    tbody = next((child for child in tgroup if isinstance(child, docutils.nodes.tbody)), None)
+
+    if tbody is None or len(tbody) < rows:
+        return value
+
+    # the widths of the large tables are computed once, unless they are given
+    if 'colwidths-given' not in value['classes'] and len(set(colspec.get('colwidth') for colspec in colspecs)) == 1:
+        fixups_table_widths(colspecs, [] if thead is None else thead.children, tbody.children, sample)
+
+    if chunk <= 0 or len(tbody) <= chunk:
+        return value
+
+    # the following chunks repeat the columns and the head of the table, and are inserted after it
+    chunks = fixups_table_split(tbody, chunk)
+    tbody.children = chunks[0]
+    index = value.parent.index(value)
+
+    for chunk_rows in chunks[1:]:
+        chunk_table = value.copy()
+        chunk_table['ids'] = []
+        chunk_table['names'] = []
+        chunk_tgroup = tgroup.copy()
+        chunk_tgroup.extend([colspec.deepcopy() for colspec in colspecs])
+        if thead is not None:
+            chunk_tgroup.append(thead.deepcopy())
+        chunk_tbody = tbody.copy()
+        chunk_tbody.extend(chunk_rows)
+        chunk_tgroup.append(chunk_tbody)
+        chunk_table.append(chunk_tgroup)
+        index += 1
+        value.parent.insert(index, chunk_table)
+
+    return value
+
+
+fixups_actions = {
+    'unwrap': lambda node, rule: fixups_unwrap(node, class_names=rule['children']),
+    'wrap': lambda node, rule: fixups_wrap(node, class_names=rule['children']),
+    'update': lambda node, rule: fixups_update(node, attributes=rule['attributes']),
+    'table': lambda node, rule: fixups_table(node, rows=rule['rows'], sample=rule['sample'], chunk=rule['chunk'])
+}
+
+
+def fixups_create_dispatch(rules):
+    dispatch = {}
+    for rule in rules:
+        if rule['action'] not in fixups_actions:
+            raise Exception(f"Unsupported rule action: '{rule['action']}'")
+        for class_name in rule['nodes']:
+            dispatch.setdefault(class_name, []).append(rule)
+    return dispatch
+
+
+def fixups_is_scoped(node, scope):
+    while node is not None:
+        if node.__class__.__name__ in scope:
+            return True
+        node = node.parent
+    return False
+
+
+def fixups_apply_rules(node, scoped, dispatch):
+    # the rules of the node only, its children are already fixed
+    for rule in dispatch.get(node.__class__.__name__, []):
+        if rule.get('scoped', True) and not scoped:
+            continue
+        if any(node.get(key) != expected for key, expected in rule.get('condition', {}).items()):
+            continue
+        fixups_actions[rule['action']](node, rule)
+
+
+def fixups_fix_node(value, include_self=True, scope=None, dispatch=None, scoped=None):
+    if scope is None:
+        scope = fixups_scope
+
+    if dispatch is None:
+        dispatch = fixups_create_dispatch(fixups_rules)
+
+    if scoped is None:
+        scoped = fixups_is_scoped(value, scope)
+
+    # single post-order pass: every rule is applied to a node after its
+    # children, and only changes the children of that node
+    stack = [[value, 0, scoped]]
+
+    while len(stack) > 0:
+        entry = stack[-1]
+        node, child_index, scoped = entry
+
+        if child_index < len(node.children):
+            entry[1] = child_index + 1
+            child = node.children[child_index]
+            if isinstance(child, docutils.nodes.Element):
+                stack.append([child, 0, scoped or child.__class__.__name__ in scope])
+            continue
+
+        stack.pop()
+
+        if len(stack) == 0 and not include_self:
+            continue
+
+        siblings = len(stack[-1][0].children) if len(stack) > 0 else 0
+
+        fixups_apply_rules(node, scoped, dispatch)
+
+        # the siblings inserted after the node by its rules are already fixed
+        if len(stack) > 0:
+            stack[-1][1] += len(stack[-1][0].children) - siblings
+
+    return value
@@ -0,0 +1,374 @@
+import re
+import glob
+import json
+import shutil
+import hashlib
+import inspect
+from pathlib import Path
+from xml.etree import ElementTree
+
+import sphinx.util
+from docutils import nodes
+from sphinx.util.docutils import SphinxDirective
+
+from . import breathe_patch
+from .util import file_digest
+from .util import atomic_write
+
+logger = sphinx.util.logging.getLogger(__name__)
+
+# the version of the cached fragments of the gtest results, changed with their format
+gtest_cache_version = 1
+# the values of the 'result' attribute of the generated items, accepted by its regex, see 'config_inited'
+gtest_results = ['pass', 'fail', 'error', 'skip']
+gtest_cache_dir_name = 'gtest_cache'
+
+# per-process state, the directories of the fragments used by the generated includes, see 'gtest_prune_cache'
+gtest_cache_used = set()
+
+
+def generate_lines(app, include):
+    return '\n'.join(include['lines'])
+
+
+def generate_doxygen(app, include):
+    project = include.get('project', app.config.breathe_default_project)
+    kinds = include.get('kinds', ['class', 'struct'])
+    title = include.get('title', 'API')
+    options = include.get('options', [':members:'])
+
+    index = breathe_patch.breathe_cached_parse_index(
+        str(Path(app.confdir).joinpath(app.config.breathe_projects[project], 'index.xml'))
+    )
+
+    lines = ['#' * len(title), title, '#' * len(title), '']
+    compounds = [compound for compound in index.compound if compound.kind in kinds]
+    for compound in sorted(compounds, key=lambda c: (kinds.index(c.kind), c.name)):
+        lines.append(f".. doxygen{compound.kind}:: {compound.name}")
+        lines.append(f"   :project: {project}")
+        lines += ['   ' + option for option in options]
+        lines.append('')
+
+    return '\n'.join(lines)
+
+
+def gtest_escape(text):
+    return re.sub(r'([\\*`_|])', r'\\\1', text)
+
+
+class GtestResultsDirective(SphinxDirective):
+    # the result table of the cases of a suite, one line per case with the values separated by ' | ',
+    # the cells are plain text, built without parsing them, which is most of the time of thousands of tables
+    has_content = True
+
+    header = ['Case', 'Result', 'Time', 'Location']
+    widths = [4, 1, 1, 2]
+
+    def row(self, values):
+        row = nodes.row()
+        for value in values:
+            entry = nodes.entry()
+            entry += nodes.paragraph(text=value)
+            row += entry
+        return row
+
+    def run(self):
+        table = nodes.table(classes=['gtest-results'])
+        tgroup = nodes.tgroup(cols=len(self.header))
+        table += tgroup
+        for width in self.widths:
+            tgroup += nodes.colspec(colwidth=width)
+        thead = nodes.thead()
+        thead += self.row(self.header)
+        tgroup += thead
+        tbody = nodes.tbody()
+        for line in self.content:
+            values = line.split(' | ', len(self.header) - 1)
+            tbody += self.row(values + [''] * (len(self.header) - len(values)))
+        tgroup += tbody
+        return [table]
+
+
+def gtest_case(suite, element, include):
+    # the row of the result table and the traceability item of the case,
+    # its requirements are the values of the property, the item has the failures only
+    name = element.get('name', '')
+    prefix = include.get('prefix', 'TEST_')
+    relation = include.get('relation', 'validates')
+    properties = {p.get('name'): p.get('value', '') for p in element.iter('property')}
+    values = properties.get(include.get('property', 'requirements'), element.get(include.get('property', 'requirements'), ''))
+    requirements = [value for value in re.split(r'[,\s]+', values) if value != '']
+
+    failures = [child for child in element if child.tag in ['failure', 'error']]
+    if any(child.tag == 'error' for child in failures):
+        result = 'error'
+    elif len(failures) > 0:
+        result = 'fail'
+    elif element.find('skipped') is not None or element.get('result') == 'skipped' or element.get('status') == 'notrun':
+        result = 'skip'
+    else:
+        result = 'pass'
+
+    location = '' if element.get('file') is None else f"{Path(element.get('file')).name}:{element.get('line', '')}"
+    row = ' | '.join([name, result, f"{element.get('time', '')} s", location]).replace('\n', ' ')
+
+    lines = [f".. item:: {re.sub(r'[^A-Za-z0-9_]', '_', prefix + suite + '_' + name)} {gtest_escape(suite + '.' + name)}"]
+    if len(requirements) > 0:
+        lines.append(f"   :{relation}: {' '.join(requirements)}")
+    lines.append(f"   :result: {result}")
+    lines.append('')
+
+    for failure in failures:
+        text = (failure.text or '').strip() or failure.get('message', '').strip()
+        if text == '':
+            continue
+        lines.append('   ::')
+        lines.append('')
+        lines += ['      ' + line.rstrip() for line in text.splitlines()]
+        lines.append('')
+
+    return row, lines, result, float(element.get('time', '0') or '0')
+
+
+def gtest_parse(filename, directory, include):
+    # the file is parsed as a stream, the rows and items of every suite are written to its fragments
+    # as they are parsed and the elements are released, so the memory does not grow with the file
+    suites = []
+    suite = None
+    fragments = None
+    root = None
+    suite_element = None
+
+    for event, element in ElementTree.iterparse(filename, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            elif element.tag == 'testsuite':
+                suite_element = element
+                suite = {
+                    'name': element.get('name', ''),
+                    'fragment': str(len(suites)),
+                    'digest': hashlib.sha256(),
+                    'tests': 0,
+                    'failures': 0,
+                    'errors': 0,
+                    'skipped': 0,
+                    'time': 0.0
+                }
+                fragments = [directory.joinpath(f"{suite['fragment']}{suffix}").open('w', encoding='utf-8') for suffix in ['.rows', '.rst']]
+            continue
+
+        if element.tag == 'testcase' and suite is not None:
+            row, lines, result, time = gtest_case(suite['name'], element, include)
+            for fragment, text in zip(fragments, ['   ' + row + '\n', '\n'.join(lines) + '\n']):
+                fragment.write(text)
+                suite['digest'].update(text.encode('utf-8'))
+            suite['tests'] += 1
+            suite['failures'] += 1 if result == 'fail' else 0
+            suite['errors'] += 1 if result == 'error' else 0
+            suite['skipped'] += 1 if result == 'skip' else 0
+            suite['time'] += time
+            suite_element.clear()
+        elif element.tag == 'testsuite' and suite is not None:
+            for fragment in fragments:
+                fragment.close()
+            suite['digest'] = suite['digest'].hexdigest()
+            suites.append(suite)
+            suite = None
+            root.clear()
+
+    if suite is not None:
+        for fragment in fragments:
+            fragment.close()
+
+    return suites
+
+
+def gtest_fragments(app, filename, include):
+    # the fragments of the suites of a result file, keyed by its content and the options,
+    # only the new and changed result files are parsed
+    key = hashlib.sha256(json.dumps([
+        gtest_cache_version,
+        file_digest(filename),
+        include.get('prefix', 'TEST_'),
+        include.get('property', 'requirements'),
+        include.get('relation', 'validates')
+    ]).encode()).hexdigest()
+    directory = Path(app.doctreedir).joinpath(gtest_cache_dir_name, key[:2], key)
+    gtest_cache_used.add(directory)
+
+    if not directory.joinpath('suites.json').is_file():
+        try:
+            with atomic_write(directory) as temporary_directory:
+                temporary_directory.mkdir(parents=True)
+                suites = gtest_parse(filename, temporary_directory, include)
+                temporary_directory.joinpath('suites.json').write_text(json.dumps(suites))
+        except ElementTree.ParseError as e:
+            logger.warning(f"-- {inspect.currentframe().f_code.co_name} ignore '{filename}': {e}")
+            return directory, []
+        except OSError:
+            # the directory written by another process is not replaced
+            if not directory.joinpath('suites.json').is_file():
+                raise
+
+    return directory, json.loads(directory.joinpath('suites.json').read_text())
+
+
+def gtest_write_suite(path, key, title, fragments):
+    # the key of the fragments is the first line, the document is written again only if it changed
+    header = f".. gtest: {key}"
+
+    if path.is_file():
+        with path.open('r', encoding='utf-8') as f:
+            if f.readline().rstrip('\n') == header:
+                return False
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_write(path) as temporary_path, temporary_path.open('w', encoding='utf-8') as f:
+        f.write('\n'.join([header, '', '#' * len(title), title, '#' * len(title), '', '.. gtest-results::', '']) + '\n')
+        for suffix in ['.rows', '.rst']:
+            for fragment in fragments:
+                with fragment.with_suffix(suffix).open('r', encoding='utf-8') as source:
+                    shutil.copyfileobj(source, f)
+            f.write('\n')
+
+    return True
+
+
+def generate_gtest(app, include):
+    # the suites of the gtest xml results are documents next to the include, it has their summary and toctree
+    files = []
+    for pattern in include.get('files', []):
+        # relative to the 'conf.py' directory
+        files += sorted(glob.glob(str(Path(app.confdir).joinpath(pattern))))
+
+    suites = {}
+    for filename in files:
+        directory, file_suites = gtest_fragments(app, filename, include)
+        for suite in file_suites:
+            entry = suites.setdefault(suite['name'], {'keys': [], 'fragments': [], 'tests': 0, 'failures': 0, 'errors': 0, 'skipped': 0, 'time': 0.0})
+            # by the content of the fragments, a changed result file changes only the keys of its changed suites
+            entry['keys'].append(suite['digest'])
+            entry['fragments'].append(directory.joinpath(suite['fragment']))
+            for name in ['tests', 'failures', 'errors', 'skipped', 'time']:
+                entry[name] += suite[name]
+
+    path = Path(include['path'])
+    suites_dir = path.with_suffix('')
+    written = 0
+    docnames = []
+    for name in sorted(suites):
+        entry = suites[name]
+        docname = re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+        docnames.append(docname)
+        key = hashlib.sha256(json.dumps(entry['keys']).encode()).hexdigest()
+        if gtest_write_suite(Path(app.srcdir).joinpath(suites_dir, docname + '.rst'), key, gtest_escape(name), entry['fragments']):
+            written += 1
+
+    # the suites without results
+    for stale in Path(app.srcdir).joinpath(suites_dir).glob('*.rst'):
+        if stale.stem not in docnames:
+            stale.unlink()
+
+    logger.info(f"-- {inspect.currentframe().f_code.co_name}: files: {len(files)} suites: {len(suites)} written: {written}")
+
+    if len(suites) == 0:
+        return '\n'.join(['No test results.', ''])
+
+    lines = ['.. list-table::', '   :header-rows: 1', '']
+    lines += ['   * - Suite'] + ['     - ' + column for column in ['Tests', 'Failures', 'Errors', 'Skipped', 'Time']]
+    for name in sorted(suites):
+        entry = suites[name]
+        lines.append(f"   * - {gtest_escape(name)}")
+        lines += [f"     - {entry[column]}" for column in ['tests', 'failures', 'errors', 'skipped']]
+        lines.append(f"     - {entry['time']:.3f} s")
+    lines.append('')
+    # relative to the source directory, the include is not a document of its own
+    lines += ['.. toctree::', '   :maxdepth: 1', '']
+    lines += [f"   /{suites_dir.as_posix()}/{docname}" for docname in docnames]
+    lines.append('')
+
+    return '\n'.join(lines)
+
+
+def gtest_prune_cache(app):
+    # the fragments of the result files which are not generated any more, a new result file is a new key
+    cache_dir = Path(app.doctreedir).joinpath(gtest_cache_dir_name)
+    if not cache_dir.is_dir():
+        return
+
+    removed = 0
+    for directory in cache_dir.glob('*/*'):
+        # the temporary directories of the other processes are left
+        if directory in gtest_cache_used or directory.name.endswith('.tmp'):
+            continue
+        shutil.rmtree(directory, ignore_errors=True)
+        removed += 1
+
+    for directory in cache_dir.iterdir():
+        if directory.is_dir() and not any(directory.iterdir()):
+            directory.rmdir()
+
+    if removed > 0:
+        logger.info(f"-- {inspect.currentframe().f_code.co_name}: removed: {removed}")
+
+
+generators = {
+    'lines': generate_lines,
+    'doxygen': generate_doxygen,
+    'gtest': generate_gtest
+}
+
+
+def write_if_changed(path, text):
+    data = text.encode('utf-8')
+
+    # the same content keeps the modification time, so sphinx does not read the including documents again
+    if path.is_file() and hashlib.sha256(path.read_bytes()).digest() == hashlib.sha256(data).digest():
+        return False
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_write(path) as temporary_path:
+        temporary_path.write_bytes(data)
+
+    return True
+
+
+def generate_includes(app, includes):
+    for include in includes:
+        generator = include.get('generator', 'lines')
+
+        if generator not in generators:
+            raise Exception(f"Unsupported generated include generator: '{generator}'")
+
+        # relative to the source directory, where the including documents are
+        path = Path(app.srcdir).joinpath(include['path'])
+        changed = write_if_changed(path, generators[generator](app, include))
+
+        logger.info(f"-- {inspect.currentframe().f_code.co_name}: '{path}' {'written' if changed else 'unchanged'}")
+
+
+def config_inited(app, config):
+    # only included, the suites of the toctree in it would be in two toctrees
+    for include in config.generated_includes:
+        if include.get('generator') == 'gtest' and include['path'] not in config.exclude_patterns:
+            config.exclude_patterns.append(include['path'])
+
+    # replaced instead of changed, the default of 'mlx.traceability' is shared by the applications of the process
+    gtest = any(include.get('generator') == 'gtest' for include in config.generated_includes)
+    if gtest and 'traceability_attributes' in config:
+        regex = config.traceability_attributes.get('result')
+        if regex is None or not all(re.match(regex, result) for result in gtest_results):
+            config.traceability_attributes = dict(config.traceability_attributes, result=f"(?i)^({'|'.join(gtest_results)})$")
+            config.traceability_attribute_to_string = dict({'result': 'Result'}, **config.traceability_attribute_to_string)
+
+    gtest_cache_used.clear()
+    generate_includes(app, config.generated_includes)
+    gtest_prune_cache(app)
+
+
+def setup(app):
+    app.add_config_value('generated_includes', [], '')
+    app.add_directive('gtest-results', GtestResultsDirective)
+    # after the 'config-inited' of 'breathe_patch', the doxygen index is parsed with its caches
+    app.connect('config-inited', config_inited, priority=600)
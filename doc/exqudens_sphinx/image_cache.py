@@ -0,0 +1,224 @@
+import os
+import json
+import math
+import shutil
+import inspect
+from pathlib import Path
+
+import sphinx.util
+import docxbuilder.writer
+from docxbuilder.writer import DocxTranslator
+from docxbuilder.writer import convert_to_cm_size
+
+from .util import file_digest
+from .util import atomic_write
+
+# Is the PIL imaging library installed?
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = sphinx.util.logging.getLogger(__name__)
+
+image_cache_old_get_image_size = docxbuilder.writer.get_image_size
+image_cache_old_visit_image_node = DocxTranslator.visit_image_node
+
+# the handler of 'rst2pdf.genpdftext', which is imported only by the pdf builds, see 'install_pdf'
+image_cache_old_pdf_handler = {}
+
+# the formats of the resized variants, the other images are used as they are
+image_cache_variant_formats = {
+    'PNG': {'optimize': True},
+    'JPEG': {'quality': 90, 'optimize': True}
+}
+
+# on-disk cache of the image information and variants, keyed by the content hash, 'None' if disabled
+image_cache_dir = None
+image_cache_dpi = 0
+# per-process memo of the image information, kept across the applications of one process, see 'exqudens_sphinx.batch'
+image_cache_infos = {}
+image_cache_stats = {'hits': 0, 'misses': 0, 'variants': 0}
+
+
+def image_cache_info(filename):
+    # the dimensions, dpi and format of the image without decoding it again
+    digest = file_digest(filename)
+
+    if digest in image_cache_infos:
+        image_cache_stats['hits'] += 1
+        return image_cache_infos[digest]
+
+    path = Path(image_cache_dir).joinpath(digest[:2], digest + '.json')
+
+    if path.is_file():
+        try:
+            info = json.loads(path.read_text())
+            image_cache_infos[digest] = info
+            image_cache_stats['hits'] += 1
+            return info
+        except Exception as e:
+            logger.warning(f"-- {inspect.currentframe().f_code.co_name} ignore '{path}': {e}")
+
+    image_cache_stats['misses'] += 1
+    with Image.open(filename, 'r') as image:
+        dpi = image.info.get('dpi')
+        info = {
+            'digest': digest,
+            'format': image.format,
+            'width': image.size[0],
+            'height': image.size[1],
+            'dpi': None if dpi is None else [float(dpi[0]), float(dpi[1])]
+        }
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_write(path) as temporary_path:
+        temporary_path.write_text(json.dumps(info))
+
+    image_cache_infos[digest] = info
+    return info
+
+
+def image_cache_variant(filename, max_width_cm, default_dpi):
+    # the image resampled to 'image_cache_dpi' at the page width, the images are never shown wider,
+    # the dpi of the variant keeps the size of the original, so the layout is the same
+    info = image_cache_info(filename)
+
+    if info['format'] not in image_cache_variant_formats:
+        return filename
+
+    max_width = math.ceil(max_width_cm / 2.54 * image_cache_dpi)
+
+    if info['width'] <= max_width:
+        return filename
+
+    dpi = info['dpi'] or [default_dpi, default_dpi]
+    name = f"{info['digest']}.{max_width}.{dpi[0]:g}x{dpi[1]:g}"
+    # the name of the original, the docx builder shows it as the name of the picture
+    path = Path(image_cache_dir).joinpath(info['digest'][:2], name, Path(filename).name)
+
+    if path.is_file():
+        return str(path)
+
+    scale = max_width / info['width']
+    height = max(1, round(info['height'] * scale))
+
+    with Image.open(filename, 'r') as image:
+        if image.mode not in ['RGB', 'RGBA', 'L', 'LA']:
+            image = image.convert('RGBA' if info['format'] == 'PNG' else 'RGB')
+        variant = image.resize((max_width, height), Image.LANCZOS)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_write(path, suffix=path.suffix) as temporary_path:
+        variant.save(temporary_path, info['format'], dpi=(dpi[0] * scale, dpi[1] * scale), **image_cache_variant_formats[info['format']])
+
+        # the resampled drawings with few colors can compress worse than the original, then the original is kept
+        if temporary_path.stat().st_size >= os.path.getsize(filename):
+            shutil.copyfile(filename, temporary_path)
+            max_width, height = info['width'], info['height']
+
+    image_cache_stats['variants'] += 1
+    logger.info(f"-- {inspect.currentframe().f_code.co_name}: '{filename}' {info['width']}x{info['height']} -> {max_width}x{height}")
+
+    return str(path)
+
+
+def image_cache_get_image_size(filename):
+    # the same as 'docxbuilder.writer.get_image_size'
+    info = image_cache_info(filename)
+    dpi = info['dpi'] or [72, 72]
+    cmperin = 2.54
+    return (info['width'] * cmperin / dpi[0], info['height'] * cmperin / dpi[1])
+
+
+def image_cache_visit_image_node(self, node, alt, get_filepath):
+    def get_variant_filepath(translator, n):
+        filepath = get_filepath(translator, n)
+        if filepath is None or not os.path.exists(filepath):
+            return filepath
+        try:
+            return image_cache_variant(filepath, convert_to_cm_size(translator._ctx_stack[-1].paragraph_width), 72)
+        except Exception as e:
+            logger.warning(f"-- {inspect.currentframe().f_code.co_name} ignore '{filepath}': {e}")
+            return filepath
+
+    return image_cache_old_visit_image_node(self, node, alt, get_variant_filepath)
+
+
+def image_cache_pdf_handler(name):
+    old_function = image_cache_old_pdf_handler[name]
+
+    def function(self, client, node, *args):
+        # the uri relative to the source directory is replaced with the absolute path of the variant
+        # for the call only, the text width of the page is in points
+        uri = str(node.get('uri'))
+        filename = os.path.join(client.basedir, uri)
+        if '://' in uri or not os.path.isfile(filename):
+            return old_function(self, client, node, *args)
+        try:
+            variant = image_cache_variant(filename, client.styles.tw / 72 * 2.54, client.styles.def_dpi)
+        except Exception as e:
+            logger.warning(f"-- {inspect.currentframe().f_code.co_name} ignore '{filename}': {e}")
+            variant = filename
+        node['uri'] = variant
+        try:
+            return old_function(self, client, node, *args)
+        finally:
+            node['uri'] = uri
+
+    return function
+
+
+def install(config):
+    enabled = image_cache_dir is not None
+    variants = enabled and image_cache_dpi > 0
+    setattr(docxbuilder.writer, 'get_image_size', image_cache_get_image_size if enabled else image_cache_old_get_image_size)
+    setattr(DocxTranslator, 'visit_image_node', image_cache_visit_image_node if variants else image_cache_old_visit_image_node)
+
+
+def install_pdf(config):
+    # imported here, 'rst2pdf' is loaded only by the pdf builds, see 'exqudens_sphinx.builders'
+    from rst2pdf.genpdftext import HandleImage
+
+    variants = image_cache_dir is not None and image_cache_dpi > 0
+    for name in ['gather_elements', 'get_text']:
+        image_cache_old_pdf_handler.setdefault(name, getattr(HandleImage, name))
+        setattr(HandleImage, name, image_cache_pdf_handler(name) if variants else image_cache_old_pdf_handler[name])
+
+
+def config_inited(app, config):
+    global image_cache_dir
+    global image_cache_dpi
+
+    if not config.image_cache or Image is None:
+        image_cache_dir = None
+    elif config.image_cache_dir == '':
+        image_cache_dir = str(Path(app.doctreedir).joinpath('image_cache'))
+    else:
+        # relative to the 'conf.py' directory
+        image_cache_dir = str(Path(app.confdir).joinpath(config.image_cache_dir))
+
+    image_cache_dpi = config.image_cache_dpi
+
+    install(config)
+
+
+def builder_inited(app):
+    if app.builder.name == 'pdf':
+        install_pdf(app.config)
+
+
+def build_finished(app, exception):
+    if image_cache_dir is None:
+        return
+
+    logger.info(f"-- image cache dir: '{image_cache_dir}' hits: '{image_cache_stats['hits']}' misses: '{image_cache_stats['misses']}' variants: '{image_cache_stats['variants']}'")
+
+
+def setup(app):
+    app.add_config_value('image_cache', True, '')
+    app.add_config_value('image_cache_dir', '', '')
+    app.add_config_value('image_cache_dpi', 300, '')
+    app.connect('config-inited', config_inited)
+    app.connect('builder-inited', builder_inited)
+    app.connect('build-finished', build_finished)
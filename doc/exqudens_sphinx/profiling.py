@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import threading
+from pathlib import Path
+
+import sphinx.util
+from docutils.nodes import NodeVisitor
+from breathe.renderer.filter import FilterFactory
+from docxbuilder import DocxBuilder
+
+from . import fixups
+
+logger = sphinx.util.logging.getLogger(__name__)
+
+profiling_report_file_name = 'exqudens_sphinx_profile.json'
+profiling_trace_file_name = 'exqudens_sphinx_profile.trace.json'
+
+# module functions, the patched class attributes are wrapped as they are installed by the other modules
+profiling_old_fixups_fix_node = fixups.fixups_fix_node
+
+# per-process state, 'None' if disabled
+profiling_state = None
+
+
+def count_nodes(node):
+    return 0 if node is None else len(node.traverse())
+
+
+def profiling_record(name, start, end, nodes=None, trace=True):
+    hook = profiling_state['hooks'].setdefault(name, {'calls': 0, 'time': 0.0, 'nodes': 0})
+    hook['calls'] += 1
+    hook['time'] += end - start
+    if nodes is not None:
+        hook['nodes'] += nodes
+    if trace:
+        profiling_state['events'].append({
+            'name': name,
+            'cat': 'hook',
+            'ph': 'X',
+            'ts': (start - profiling_state['start']) * 1000000,
+            'dur': (end - start) * 1000000,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': {} if nodes is None else {'nodes': nodes}
+        })
+
+
+def profiling_wrap(name, function, nodes=None, trace=True):
+    # 'nodes' counts the nodes of a call from its arguments and result
+    function = getattr(function, 'profiling_wrapped', function)
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        end = time.perf_counter()
+        profiling_record(name, start, end, None if nodes is None else nodes(args, result), trace)
+        return result
+
+    wrapper.profiling_wrapped = function
+    return wrapper
+
+
+def profiling_unwrap(function):
+    return getattr(function, 'profiling_wrapped', function)
+
+
+def profiling_phase(name, function):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            end = time.perf_counter()
+            profiling_state['phases'][name] = profiling_state['phases'].get(name, 0.0) + end - start
+            profiling_state['events'].append({
+                'name': name,
+                'cat': 'phase',
+                'ph': 'X',
+                'ts': (start - profiling_state['start']) * 1000000,
+                'dur': (end - start) * 1000000,
+                'pid': os.getpid(),
+                'tid': threading.get_ident()
+            })
+
+    return wrapper
+
+
+def install(config):
+    global profiling_state
+
+    # the class attributes are set again by the other modules on every 'config-inited' or 'builder-inited',
+    # unwrapping keeps the installing idempotent if they are not
+    hooks = [
+        (DocxBuilder, 'assemble_doctree', lambda args, result: count_nodes(result), True),
+        (FilterFactory, 'create_content_filter', None, True),
+        (FilterFactory, 'create_render_filter', None, True),
+        (NodeVisitor, 'dispatch_visit', lambda args, result: 1, False)
+    ]
+
+    if not config.exqudens_sphinx_profile:
+        profiling_state = None
+        for owner, name, nodes, trace in hooks:
+            setattr(owner, name, profiling_unwrap(getattr(owner, name)))
+        setattr(fixups, 'fixups_fix_node', profiling_old_fixups_fix_node)
+        return
+
+    if profiling_state is None:
+        profiling_state = {'start': time.perf_counter(), 'hooks': {}, 'phases': {}, 'events': []}
+
+    for owner, name, nodes, trace in hooks:
+        setattr(owner, name, profiling_wrap(name, getattr(owner, name), nodes, trace))
+    setattr(fixups, 'fixups_fix_node', profiling_wrap(
+        'fixups_fix_node',
+        profiling_old_fixups_fix_node,
+        lambda args, result: count_nodes(result)
+    ))
+
+
+def config_inited(app, config):
+    global profiling_state
+
+    profiling_state = None
+    if config.exqudens_sphinx_profile:
+        profiling_state = {'start': time.perf_counter(), 'hooks': {}, 'phases': {}, 'events': []}
+
+
+def builder_inited(app):
+    install(app.config)
+
+    if profiling_state is None:
+        return
+
+    profiling_state['phases']['init'] = time.perf_counter() - profiling_state['start']
+
+    for name in ['read', 'write', 'finish']:
+        setattr(app.builder, name, profiling_phase(name, getattr(app.builder, name)))
+
+
+def build_finished(app, exception):
+    if profiling_state is None:
+        return
+
+    profiling_state['phases']['total'] = time.perf_counter() - profiling_state['start']
+
+    report = {
+        'builder': app.builder.name,
+        'pid': os.getpid(),
+        'phases': profiling_state['phases'],
+        'hooks': profiling_state['hooks']
+    }
+
+    report_path = Path(app.outdir).joinpath(profiling_report_file_name)
+    trace_path = Path(app.outdir).joinpath(profiling_trace_file_name)
+    report_path.write_text(json.dumps(report, indent=4))
+    trace_path.write_text(json.dumps({'traceEvents': profiling_state['events'], 'displayTimeUnit': 'ms'}))
+
+    logger.info(f"-- profiling report: '{report_path}' trace: '{trace_path}'")
+
+
+def setup(app):
+    app.add_config_value('exqudens_sphinx_profile', False, '')
+    app.connect('config-inited', config_inited)
+    # after the 'config-inited' and 'builder-inited' of the other modules, their patches are wrapped
+    app.connect('builder-inited', builder_inited, priority=900)
+    app.connect('build-finished', build_finished)
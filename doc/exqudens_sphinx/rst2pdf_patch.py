@@ -0,0 +1,191 @@
+import os
+import types
+import pickle
+import hashlib
+import inspect
+from pathlib import Path
+
+import sphinx.util
+
+from . import fixups
+from .util import file_digest
+from .util import atomic_write
+from .util import prune_cache_dir
+
+logger = sphinx.util.logging.getLogger(__name__)
+
+# the functions of 'rst2pdf', which is imported only by the pdf builds, see 'install'
+rst2pdf_old = {}
+
+rst2pdf_cache_version = 1
+
+# the same fixups as for the docx builds, except the numbering of the enumerated lists, which 'rst2pdf' supports,
+# the 'auto' column widths are fixed as well, 'rst2pdf' reads them with 'int'
+rst2pdf_fix_node_scope = fixups.fixups_scope
+rst2pdf_fix_node_rules = [rule for rule in fixups.fixups_rules if rule['nodes'] != ['enumerated_list']]
+
+# on-disk cache of the parsed stylesheets and font files, keyed by the content hash, 'None' if disabled
+rst2pdf_cache_dir = None
+# per-process memo of the pickled entries, kept across the applications of one process, see 'exqudens_sphinx.batch'
+rst2pdf_cache_entries = {}
+rst2pdf_cache_stats = {'hits': 0, 'misses': 0}
+
+
+def rst2pdf_cached_load(kind, version, filename, load):
+    # a new copy on every call, 'rst2pdf' changes the loaded stylesheets
+    key = hashlib.sha256(f"{rst2pdf_cache_version}:{kind}:{version}:{file_digest(filename)}".encode()).hexdigest()
+    path = Path(rst2pdf_cache_dir).joinpath(key[:2], key + '.pickle')
+    data = rst2pdf_cache_entries.get(key)
+
+    if data is None and path.is_file():
+        data = path.read_bytes()
+        # the recently used entries are kept, see 'build_finished'
+        os.utime(path)
+
+    if data is not None:
+        try:
+            result = pickle.loads(data)
+            rst2pdf_cache_entries[key] = data
+            rst2pdf_cache_stats['hits'] += 1
+            return result
+        except Exception as e:
+            logger.warning(f"-- {inspect.currentframe().f_code.co_name} ignore '{path}': {e}")
+
+    rst2pdf_cache_stats['misses'] += 1
+    result = load(filename)
+    data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+    rst2pdf_cache_entries[key] = data
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_write(path) as temporary_path:
+        temporary_path.write_bytes(data)
+
+    return result
+
+
+def rst2pdf_load_style(filename):
+    import yaml
+
+    with open(filename) as f:
+        return yaml.safe_load(f.read())
+
+
+def rst2pdf_read_style(self, ssname):
+    import yaml
+
+    # the callables, the old 'rson' stylesheets and the missing ones are read by 'rst2pdf'
+    if callable(ssname):
+        return rst2pdf_old['read_style'](self, ssname)
+
+    fname = self.findStyle(ssname)
+    if not fname or os.path.splitext(fname)[1] == '.style':
+        return rst2pdf_old['read_style'](self, ssname)
+
+    if self.record_dependencies:
+        self.record_dependencies.add(fname)
+
+    try:
+        return rst2pdf_cached_load('style', yaml.__version__, fname, rst2pdf_load_style)
+    except (ValueError, OSError):
+        # read again by 'rst2pdf', which reports the error
+        return rst2pdf_old['read_style'](self, ssname)
+
+
+def rst2pdf_load_font_file(filename):
+    # the attributes of the font file used by 'rst2pdf.findfonts.loadFonts', reading them parses the whole file
+    font = rst2pdf_old['font_file'](filename)
+    return {
+        'familyName': font.familyName,
+        'name': font.name,
+        'fullName': font.fullName,
+        'flags': font.flags
+    }
+
+
+def rst2pdf_font_file(filename):
+    import reportlab
+
+    return types.SimpleNamespace(**rst2pdf_cached_load('font', reportlab.Version, filename, rst2pdf_load_font_file))
+
+
+def rst2pdf_load_fonts(*args, **kwargs):
+    from rst2pdf import findfonts
+
+    # only while the fonts are looked up, the other users of 'findfonts.TTFontFile' get the font files with the metrics
+    setattr(findfonts, 'TTFontFile', rst2pdf_font_file)
+    try:
+        return rst2pdf_old['load_fonts'](*args, **kwargs)
+    finally:
+        setattr(findfonts, 'TTFontFile', rst2pdf_old['font_file'])
+
+
+def rst2pdf_new_assemble_doctree(self, docname, title, author, appendices):
+    tree = rst2pdf_old['assemble_doctree'](self, docname, title, author, appendices)
+
+    return fixups.fixups_fix_node(
+        tree,
+        include_self=False,
+        scope=self.config.rst2pdf_fix_node_scope,
+        dispatch=fixups.fixups_create_dispatch(self.config.rst2pdf_fix_node_rules)
+    )
+
+
+def install(config):
+    # imported here, 'rst2pdf' is loaded only by the pdf builds, see 'exqudens_sphinx.builders'
+    from rst2pdf import findfonts
+    from rst2pdf.styles import StyleSheet
+    from rst2pdf.pdfbuilder import PDFBuilder
+
+    rst2pdf_old.setdefault('assemble_doctree', PDFBuilder.assemble_doctree)
+    rst2pdf_old.setdefault('read_style', StyleSheet.readStyle)
+    rst2pdf_old.setdefault('font_file', findfonts.TTFontFile)
+    rst2pdf_old.setdefault('load_fonts', findfonts.loadFonts)
+
+    cached = rst2pdf_cache_dir is not None
+    setattr(PDFBuilder, 'assemble_doctree', rst2pdf_new_assemble_doctree if config.rst2pdf_fix_node_apply else rst2pdf_old['assemble_doctree'])
+    setattr(StyleSheet, 'readStyle', rst2pdf_read_style if cached else rst2pdf_old['read_style'])
+    # the fonts are looked up once per process, the font files are read only if a stylesheet uses a font
+    # which is not one of the standard ones, see 'rst2pdf.findfonts.loadFonts'
+    setattr(findfonts, 'loadFonts', rst2pdf_load_fonts if cached else rst2pdf_old['load_fonts'])
+
+
+def config_inited(app, config):
+    global rst2pdf_cache_dir
+
+    if not config.rst2pdf_cache:
+        rst2pdf_cache_dir = None
+    elif config.rst2pdf_cache_dir == '':
+        rst2pdf_cache_dir = str(Path(app.doctreedir).joinpath('rst2pdf_cache'))
+    else:
+        # relative to the 'conf.py' directory
+        rst2pdf_cache_dir = str(Path(app.confdir).joinpath(config.rst2pdf_cache_dir))
+
+
+def builder_inited(app):
+    if app.builder.name == 'pdf':
+        install(app.config)
+
+
+def build_finished(app, exception):
+    if rst2pdf_cache_dir is None or app.builder.name != 'pdf':
+        return
+
+    logger.info(f"-- rst2pdf cache dir: '{rst2pdf_cache_dir}' hits: '{rst2pdf_cache_stats['hits']}' misses: '{rst2pdf_cache_stats['misses']}'")
+
+    # the entries are keyed by the content of the stylesheets and fonts, the ones of the changed files are not used any more
+    if rst2pdf_cache_stats['misses'] > 0:
+        removed = prune_cache_dir(rst2pdf_cache_dir, app.config.rst2pdf_cache_dir_size, '*.pickle')
+        if removed > 0:
+            logger.info(f"-- rst2pdf cache dir removed: '{removed}'")
+
+
+def setup(app):
+    app.add_config_value('rst2pdf_fix_node_apply', True, '')
+    app.add_config_value('rst2pdf_fix_node_scope', rst2pdf_fix_node_scope, '')
+    app.add_config_value('rst2pdf_fix_node_rules', rst2pdf_fix_node_rules, '')
+    app.add_config_value('rst2pdf_cache', True, '')
+    app.add_config_value('rst2pdf_cache_dir', '', '')
+    app.add_config_value('rst2pdf_cache_dir_size', 64 << 20, '')
+    app.connect('config-inited', config_inited)
+    app.connect('builder-inited', builder_inited)
+    app.connect('build-finished', build_finished)
@@ -0,0 +1,286 @@
+import inspect
+
+import sphinx
+import sphinx.util
+from sphinx.environment import BuildEnvironment
+from natsort import natsorted
+from mlx.traceable_collection import TraceableCollection
+from mlx.traceable_base_node import TraceableBaseNode
+from mlx.directives.item_directive import Item
+from mlx.directives.item_matrix_directive import ItemMatrix
+from mlx.traceability import add_checklist_attribute
+
+logger = sphinx.util.logging.getLogger(__name__)
+
+traceability_old_are_related = TraceableCollection.are_related
+traceability_old_process_relationships = Item._process_relationships
+traceability_old_add_internal_targets = ItemMatrix.__dict__['add_internal_targets']
+traceability_old_update_config = BuildEnvironment._update_config
+
+# the versions of Sphinx the private 'BuildEnvironment._update_config' was checked against, see 'install'
+traceability_update_config_versions = [(6, 2)]
+
+# the configuration values changed by 'mlx.traceability' on 'builder-inited', see 'traceability_update_config'
+traceability_runtime_config = ['traceability_checklist', 'traceability_attributes', 'traceability_attribute_to_string']
+# the keys of 'traceability_checklist' set while reading, and the ones querying the merge request of the checklist
+traceability_checklist_read_keys = ['has_checklist_items']
+traceability_checklist_query_keys = ['merge_request_id']
+
+# per-process state, the index of the environment being written, 'None' until its items are final
+traceability_index = None
+# the positions of the target ids of the matrix being rendered
+traceability_matrix_positions = {'target_ids': None, 'positions': None}
+
+
+def traceability_item_relations(item):
+    # the explicit and implicit targets of every relation type, the reverse ones included,
+    # the relations without targets are skipped, the same as 'TraceableItem.all_relations'
+    relations = {}
+    for database in [item.explicit_relations, item.implicit_relations]:
+        for relation, targets in database.items():
+            if len(targets) > 0:
+                relations.setdefault(relation, set()).update(targets)
+    return {relation: frozenset(targets) for relation, targets in relations.items()}
+
+
+def traceability_update_index(index, collection):
+    # only the entries of the changed items are sorted again, by 'TraceableItem.all_relations',
+    # the placeholders have no entry, they are neither source nor target of 'TraceableCollection.are_related',
+    # the targets are kept, the placeholders included, the same as for 'Item._process_relationships'
+    updated = 0
+
+    for item_id, item in collection.items.items():
+        if item.is_placeholder:
+            continue
+        relations = traceability_item_relations(item)
+        entry = index.get(item_id)
+        if entry is not None and entry['relations'] == relations:
+            continue
+        index[item_id] = {
+            'relations': relations,
+            'sorted': tuple((relation, tuple(targets)) for relation, targets in item.all_relations)
+        }
+        updated += 1
+
+    for item_id in [item_id for item_id in index if item_id not in collection.items or collection.items[item_id].is_placeholder]:
+        del index[item_id]
+
+    return updated
+
+
+def traceability_are_related(self, source_id, relations, target_id):
+    if traceability_index is None:
+        return traceability_old_are_related(self, source_id, relations, target_id)
+
+    # a placeholder has no entry, see 'traceability_update_index'
+    entry = traceability_index.get(source_id)
+    if entry is None or target_id not in traceability_index:
+        return False
+    if not relations:
+        relations = self.relations
+    return any(target_id in entry['relations'].get(relation, ()) for relation in relations)
+
+
+def traceability_process_relationships(self, *args):
+    entry = None if traceability_index is None else traceability_index.get(self._item.identifier)
+    if entry is None:
+        return traceability_old_process_relationships(self, *args)
+
+    for relation, targets in entry['sorted']:
+        self._list_targets_for_relation(relation, targets, *args)
+
+
+def traceability_add_internal_targets(right_cells, source_id, targets_with_ids, relationships, collection):
+    if traceability_index is None:
+        return traceability_old_add_internal_targets.__func__(right_cells, source_id, targets_with_ids, relationships, collection)
+
+    entry = traceability_index.get(source_id)
+    if entry is None:
+        return False
+    if not relationships:
+        relationships = collection.relations
+
+    # the placeholders excluded, see 'traceability_are_related'
+    related = set()
+    for relation in relationships:
+        related.update(target_id for target_id in entry['relations'].get(relation, ()) if target_id in traceability_index)
+
+    # the related targets in the order of the matrix, instead of a check of every target
+    has_internal_target = False
+    for idx, target_ids in enumerate(targets_with_ids):
+        if traceability_matrix_positions['target_ids'] is not target_ids:
+            traceability_matrix_positions['target_ids'] = target_ids
+            traceability_matrix_positions['positions'] = {target_id: i for i, target_id in enumerate(target_ids)}
+        positions = traceability_matrix_positions['positions']
+        for target_id in sorted((t for t in related if t in positions), key=positions.__getitem__):
+            right_cells[idx].append(collection.get_item(target_id))
+            has_internal_target = True
+    return has_internal_target
+
+
+def traceability_runtime_values(config):
+    # the values of 'traceability_runtime_config' after 'mlx.traceability.initialize_environment', without the query
+    checklist = {key: value for key, value in config.traceability_checklist.items() if key not in traceability_checklist_query_keys}
+    attributes = dict(config.traceability_attributes)
+    attribute_to_string = dict(config.traceability_attribute_to_string)
+    add_checklist_attribute(checklist, attributes, attribute_to_string)
+    checklist.update({key: config.traceability_checklist[key] for key in traceability_checklist_query_keys if key in config.traceability_checklist})
+    return [checklist, attributes, attribute_to_string]
+
+
+def traceability_update_config(self, config):
+    # the pickled values are the changed ones, equal to the new ones changed the same way, they are taken
+    # as the new ones, otherwise the environment is read again on every build,
+    # the pickled configuration is replaced by the new one after the comparison
+    if self.config is None or any(name not in config for name in traceability_runtime_config):
+        return traceability_old_update_config(self, config)
+
+    try:
+        expected = traceability_runtime_values(config)
+    except Exception:
+        # reported by 'mlx.traceability' on 'builder-inited'
+        return traceability_old_update_config(self, config)
+
+    for name, value in zip(traceability_runtime_config, expected):
+        old_value = getattr(self.config, name, None)
+        if name == 'traceability_checklist' and isinstance(old_value, dict):
+            old_value = {key: v for key, v in old_value.items() if key not in traceability_checklist_read_keys}
+            value = {key: v for key, v in value.items() if key not in traceability_checklist_read_keys}
+        if old_value == value:
+            setattr(self.config, name, config[name])
+
+    return traceability_old_update_config(self, config)
+
+
+def install(config):
+    global traceability_index
+
+    traceability_index = None
+    traceability_matrix_positions['target_ids'] = None
+    traceability_matrix_positions['positions'] = None
+
+    # only while the environment is loaded, from 'config_inited' to 'builder_inited', after the warm environment
+    # of 'builders.builder_inited', so the other applications of the process are not changed
+    if sphinx.version_info[:2] in traceability_update_config_versions and all(name in config for name in traceability_runtime_config):
+        setattr(BuildEnvironment, '_update_config', traceability_update_config)
+    else:
+        setattr(BuildEnvironment, '_update_config', traceability_old_update_config)
+
+    if config.traceability_relationship_index:
+        setattr(TraceableCollection, 'are_related', traceability_are_related)
+        setattr(Item, '_process_relationships', traceability_process_relationships)
+        setattr(ItemMatrix, 'add_internal_targets', staticmethod(traceability_add_internal_targets))
+    else:
+        setattr(TraceableCollection, 'are_related', traceability_old_are_related)
+        setattr(Item, '_process_relationships', traceability_old_process_relationships)
+        setattr(ItemMatrix, 'add_internal_targets', traceability_old_add_internal_targets)
+
+
+def config_inited(app, config):
+    install(config)
+
+
+def doctree_read(app, doctree):
+    env = app.env
+
+    if not hasattr(env, 'traceability_docnames'):
+        env.traceability_docnames = set()
+
+    if next(iter(doctree.traverse(TraceableBaseNode)), None) is not None:
+        env.traceability_docnames.add(env.docname)
+
+
+def env_purge_doc(app, env, docname):
+    if hasattr(env, 'traceability_docnames'):
+        env.traceability_docnames.discard(docname)
+
+
+def env_merge_info(app, env, docnames, other):
+    if not hasattr(env, 'traceability_docnames'):
+        env.traceability_docnames = set()
+
+    env.traceability_docnames.update(getattr(other, 'traceability_docnames', set()))
+
+
+def builder_inited(app):
+    global traceability_index
+
+    # the environment is loaded, the warm one included, see 'install'
+    setattr(BuildEnvironment, '_update_config', traceability_old_update_config)
+
+    # 'mlx.traceability' empties the collection of the environment on 'builder-inited',
+    # with items it is the resolved environment of another process, see 'builders.builder_inited'
+    collection = getattr(app.env, 'traceability_collection', None)
+    if collection is not None and len(collection.items) > 0 and hasattr(app.env, 'traceability_relationship_index'):
+        traceability_index = app.env.traceability_relationship_index
+
+
+def env_get_outdated(app, env, added, changed, removed):
+    # 'mlx.traceability' collects the items again on every build, so the documents with the items
+    # and with the nodes rendered from them are read again, unless nothing changed
+    # and the collection is the resolved one of another process, see 'builder_inited'
+    if not app.config.traceability_relationship_index:
+        return []
+
+    collection = getattr(env, 'traceability_collection', None)
+    if len(added) + len(changed) + len(removed) == 0 and collection is not None and len(collection.items) > 0:
+        return []
+
+    docnames = getattr(env, 'traceability_docnames', set())
+    return sorted(docname for docname in docnames if docname in env.found_docs and docname not in removed and docname not in changed)
+
+
+def env_before_read_docs(app, env, docnames):
+    global traceability_index
+
+    # the collection of a resolved or kept environment, see 'builders.builder_inited', is complete,
+    # if anything is read again, it is emptied and the items of all documents are collected again,
+    # the same as after the 'builder-inited' of 'mlx.traceability'
+    collection = getattr(env, 'traceability_collection', None)
+    if len(docnames) == 0 or collection is None or len(collection.items) == 0:
+        return
+
+    env.traceability_collection = TraceableCollection()
+    env.traceability_ref_nodes = {}
+    traceability_index = None
+
+    read = set(docnames)
+    docnames.extend(sorted(
+        docname for docname in getattr(env, 'traceability_docnames', set()) if docname in env.found_docs and docname not in read
+    ))
+
+
+def env_updated(app, env):
+    # stored in the environment, so the next builds only update it
+    if not app.config.traceability_relationship_index or not hasattr(env, 'traceability_collection'):
+        return
+
+    if not hasattr(env, 'traceability_relationship_index'):
+        env.traceability_relationship_index = {}
+
+    updated = traceability_update_index(env.traceability_relationship_index, env.traceability_collection)
+
+    logger.info(f"-- {inspect.currentframe().f_code.co_name}: updated: {updated} items: {len(env.traceability_relationship_index)}")
+
+
+def env_check_consistency(app, env):
+    global traceability_index
+
+    # after the 'env-check-consistency' of 'mlx.traceability', the item-link and item-relink effects are applied
+    env_updated(app, env)
+
+    if hasattr(env, 'traceability_relationship_index'):
+        traceability_index = env.traceability_relationship_index
+
+
+def setup(app):
+    app.add_config_value('traceability_relationship_index', True, '')
+    app.connect('config-inited', config_inited)
+    app.connect('builder-inited', builder_inited, priority=900)
+    app.connect('doctree-read', doctree_read)
+    app.connect('env-purge-doc', env_purge_doc)
+    app.connect('env-merge-info', env_merge_info)
+    app.connect('env-get-outdated', env_get_outdated)
+    app.connect('env-before-read-docs', env_before_read_docs)
+    app.connect('env-updated', env_updated)
+    app.connect('env-check-consistency', env_check_consistency, priority=600)
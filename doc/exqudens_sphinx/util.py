@@ -0,0 +1,177 @@
+import os
+import shutil
+import inspect
+import hashlib
+from pathlib import Path
+from contextlib import contextmanager
+from collections import OrderedDict
+
+import sphinx.util
+import docutils.nodes
+
+logger = sphinx.util.logging.getLogger(__name__)
+
+# per-process memo of the content hashes of the files, checked by the modification time and size
+file_digests = {}
+
+
+def to_node_string(node, include_path=True):
+    if node is None:
+        raise Exception("'node' is None")
+    if include_path:
+        path = []
+        n = node
+        while n is not None:
+            path.append(n)
+            n = n.parent
+        path.reverse()
+        path.pop(len(path) - 1)
+        strings = [i.astext() if isinstance(i, docutils.nodes.Text) else i.__class__.__name__ for i in path]
+        node_string = "['" + "', '".join(strings) + "']: '" + (node.astext() if isinstance(node, docutils.nodes.Text) else node.__class__.__name__)
+    else:
+        node_string = node.astext() if isinstance(node, docutils.nodes.Text) else node.__class__.__name__
+    return node_string
+
+
+def log_node(node, max_depth=None, node_types=None, sample=1, limit=None):
+    # the path from the root of every leaf node is logged as the nodes are traversed,
+    # only the current path is kept, so the memory is bounded by the depth of the tree instead of its size
+    # 'max_depth': the paths are cut below that depth relative to 'node' and end with '...'
+    # 'node_types': the class names of the logged subtrees, all if 'None'
+    # 'sample': every n-th selected path is logged
+    # 'limit': the maximum number of the logged paths
+    logger.info(f"-- {inspect.currentframe().f_code.co_name} start")
+
+    # the ancestors of 'node' start every path
+    path = []
+    n = node.parent
+    while n is not None:
+        path.insert(0, to_node_string(n, include_path=False))
+        n = n.parent
+    base = len(path)
+
+    selected_count = 0
+    logged_count = 0
+    stack = [(node, 0, node_types is None)]
+    while len(stack) > 0:
+        n, depth, selected = stack.pop()
+        del path[base + depth:]
+        path.append(to_node_string(n, include_path=False))
+        selected = selected or n.__class__.__name__ in node_types
+        children = [] if isinstance(n, docutils.nodes.Text) else n.children
+        cut = max_depth is not None and depth >= max_depth and len(children) > 0
+
+        if len(children) == 0 or cut:
+            if selected:
+                if selected_count % sample == 0:
+                    logger.info(f"-- {path + ['...'] if cut else path}")
+                    logged_count += 1
+                selected_count += 1
+                if limit is not None and logged_count >= limit:
+                    logger.info(f"-- {inspect.currentframe().f_code.co_name} limit: {limit}")
+                    break
+            continue
+
+        for child in reversed(children):
+            stack.append((child, depth + 1, selected))
+
+    logger.info(f"-- {inspect.currentframe().f_code.co_name} end: {logged_count} of {selected_count}")
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze(v) for v in value)
+    return value
+
+
+def create_lru_cache(size):
+    return {'size': size, 'entries': OrderedDict(), 'hits': 0, 'misses': 0}
+
+
+def lru_cache_get(cache, key, function):
+    try:
+        hash(key)
+    except TypeError:
+        cache['misses'] += 1
+        return function()
+
+    entries = cache['entries']
+
+    if key in entries:
+        entries.move_to_end(key)
+        cache['hits'] += 1
+        return entries[key]
+
+    cache['misses'] += 1
+    value = function()
+    entries[key] = value
+
+    if len(entries) > cache['size']:
+        entries.popitem(last=False)
+
+    return value
+
+
+def file_digest(filename):
+    stat = os.stat(filename)
+    key = (stat.st_mtime_ns, stat.st_size)
+    entry = file_digests.get(filename)
+
+    if entry is None or entry[0] != key:
+        # read in chunks, the test results can be large
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        entry = (key, digest.hexdigest())
+        file_digests[filename] = entry
+
+    return entry[1]
+
+
+@contextmanager
+def atomic_write(path, suffix=''):
+    # the path of a temporary file or directory next to 'path', which replaces 'path' if the block succeeds,
+    # the parallel processes can write the same entry, each one writes its own temporary path
+    path = Path(path)
+    temporary_path = path.with_name(f"{path.name}.{os.getpid()}.tmp{suffix}")
+    remove_path(temporary_path)
+    try:
+        yield temporary_path
+        os.replace(temporary_path, path)
+    finally:
+        remove_path(temporary_path)
+
+
+def prune_cache_dir(path, max_size, pattern):
+    # the least recently used entries are removed until the rest fit in 'max_size' bytes,
+    # the entries are touched when they are used, only the files matching 'pattern' are entries
+    entries = []
+    for entry in Path(path).rglob(pattern):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, entry))
+
+    size = sum(entry[1] for entry in entries)
+    removed = 0
+    for mtime_ns, entry_size, entry in sorted(entries):
+        if size <= max_size:
+            break
+        entry.unlink(missing_ok=True)
+        size -= entry_size
+        removed += 1
+
+    return removed
+
+
+def remove_path(path):
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
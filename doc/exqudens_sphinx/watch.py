@@ -0,0 +1,210 @@
+"""
+Builds sphinx-doc targets once and again on every change of their sources, in one long-running process.
+
+The targets are the ones of 'exqudens_sphinx.batch'. The imports, the parsed doxygen files
+and the environment of every target are kept in memory between the builds:
+
+- the changed files of 'doc' rebuild the targets with them, 'conf.py' and 'name-version.txt' all targets
+- the changed doxygen xml files rebuild the targets with the breathe project, only the documents
+  with the changed compounds are read again, see 'exqudens_sphinx.breathe_patch'
+- the first builder of a target reads the changed documents and writes its own output,
+  the other builders write only if anything was read
+
+With '--port' the project directory is served over http, the html output is at 'build/doc/<target>/html'.
+
+Usage:
+
+    python doc/exqudens_sphinx/watch.py doc/sphinx-doc-all.json --target sphinx-doc-designs --builder html --port 8000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import functools
+from pathlib import Path
+from http.server import ThreadingHTTPServer
+from http.server import SimpleHTTPRequestHandler
+
+if __package__ in [None, '']:
+    # run as a script, 'doc' instead of 'doc/exqudens_sphinx'
+    sys.path[0] = str(Path(__file__).parent.parent)
+
+from sphinx.util.docutils import docutils_namespace
+from sphinx.util.docutils import patch_docutils
+
+from exqudens_sphinx import batch
+from exqudens_sphinx import builders
+
+doc_dir = Path(__file__).parent.parent
+project_dir = doc_dir.parent
+
+
+def watched_paths(target, project_dir, source_dir):
+    # the sources of the target, the doxygen xml directories of its breathe projects
+    conf_json = batch.parse_conf_json_vars(target.get('conf_json_vars', []), project_dir)
+    source_doc_dir = Path(conf_json['PROJECT_DIR']).joinpath('doc')
+    files = ['conf.py'] + target.get('files', []) + target.get('extra_files', [])
+    paths = [str(source_doc_dir.joinpath(file)) for file in files]
+    paths.append(str(Path(conf_json['PROJECT_DIR']).joinpath('name-version.txt')))
+    directories = [str(Path(path)) for path in batch.read_breathe_projects(source_dir).values()]
+    return paths, directories
+
+
+def snapshot(paths, directories):
+    result = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            result[path] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            result[path] = None
+    for directory in directories:
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name.endswith('.xml'):
+                stat = entry.stat()
+                result[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    return result
+
+
+def build_builder(target, source_dir, output_dir, builder, env):
+    # the application is created again, the environment of the previous build is kept, see 'builders.builder_inited'
+    result = {'builder': builder, 'status': 0, 'updated': False, 'env': None}
+    start = time.perf_counter()
+
+    def env_check_consistency(app, env):
+        # only if anything was read
+        result['updated'] = True
+
+    cwd = os.getcwd()
+    os.chdir(source_dir)
+    builders.builders_warm_env = env
+    try:
+        with patch_docutils(str(source_dir)), docutils_namespace():
+            app = batch.create_app(target, source_dir, output_dir, builder, freshenv=env is not None)
+            app.connect('env-check-consistency', env_check_consistency, priority=999)
+            app.build()
+            result['status'] = app.statuscode
+            result['env'] = app.env
+    except Exception as e:
+        result['status'] = 1
+        result['error'] = f"{builder}: {e}"
+    finally:
+        builders.builders_warm_env = None
+        os.chdir(cwd)
+
+    result['time'] = time.perf_counter() - start
+    return result
+
+
+def build_target(target, project_dir, state, target_builders):
+    result = {'name': target['name'], 'status': 0, 'timings': {}}
+    start = time.perf_counter()
+
+    source_dir, output_dir = batch.stage_target(target, project_dir)
+    result['timings']['stage'] = time.perf_counter() - start
+
+    updated = state.get('env') is None
+    for index, builder in enumerate(target_builders):
+        # the output of the other builders is current, unless the first builder read anything
+        if index > 0 and not updated:
+            continue
+        builder_result = build_builder(target, source_dir, output_dir, builder, state.get('env'))
+        result['status'] = max(result['status'], builder_result['status'])
+        result['timings'][builder] = builder_result['time']
+        if 'error' in builder_result:
+            result['error'] = builder_result['error']
+            state['env'] = None
+            break
+        state['env'] = builder_result['env']
+        if index == 0:
+            updated = updated or builder_result['updated']
+
+    if 'paths' not in state:
+        state['paths'], state['directories'] = watched_paths(target, project_dir, source_dir)
+
+    result['timings']['total'] = time.perf_counter() - start
+    return result
+
+
+def print_result(result):
+    timings = ' '.join(f"{name}: {value:.3f}s" for name, value in result['timings'].items())
+    print(f"-- {result['name']}: status: {result['status']} {timings}" + (f" error: {result['error']}" if 'error' in result else ''))
+
+
+def serve(directory, port):
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=str(directory))
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"-- serve: 'http://127.0.0.1:{server.server_address[1]}/' directory: '{directory}'")
+    return server
+
+
+def watch(targets, project_dir, target_builders=None, interval=0.5):
+    states = {target['name']: {} for target in targets}
+
+    def builders_of(target):
+        names = target.get('builders', ['html'])
+        return names if target_builders is None else [name for name in names if name in target_builders]
+
+    for target in targets:
+        print_result(build_target(target, project_dir, states[target['name']], builders_of(target)))
+
+    paths = {path for state in states.values() for path in state['paths']}
+    directories = {directory for state in states.values() for directory in state['directories']}
+    files = snapshot(paths, directories)
+    print(f"-- watch: files: {len(files)}")
+
+    while True:
+        time.sleep(interval)
+        new_files = snapshot(paths, directories)
+        changed = [path for path in new_files.keys() | files.keys() if new_files.get(path) != files.get(path)]
+        files = new_files
+        if len(changed) == 0:
+            continue
+
+        start = time.perf_counter()
+        print(f"-- changed: {sorted(changed)}")
+        for target in targets:
+            state = states[target['name']]
+            affected = any(
+                path in state['paths'] or str(Path(path).parent) in state['directories'] for path in changed
+            )
+            if affected:
+                print_result(build_target(target, project_dir, state, builders_of(target)))
+        print(f"-- rebuilt: {time.perf_counter() - start:.3f}s")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('targets_file')
+    parser.add_argument('--project-dir', default=str(project_dir))
+    parser.add_argument('--target', action='append', default=[])
+    parser.add_argument('--builder', action='append', default=[])
+    parser.add_argument('--interval', type=float, default=0.5)
+    parser.add_argument('--port', type=int)
+    args = parser.parse_args(args)
+
+    targets = json.loads(Path(args.targets_file).read_text())['targets']
+    if len(args.target) > 0:
+        targets = [target for target in targets if target['name'] in args.target]
+
+    if args.port is not None:
+        serve(Path(args.project_dir), args.port)
+
+    try:
+        watch(targets, args.project_dir, args.builder if len(args.builder) > 0 else None, args.interval)
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
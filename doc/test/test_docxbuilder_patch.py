@@ -0,0 +1,82 @@
+# Tests of the docx assembly against the one of 'docxbuilder':
+#
+#   python -m unittest discover -s doc/test
+import re
+import sys
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sphinx.application import Sphinx
+from sphinx.util.docutils import docutils_namespace
+from sphinx.util.docutils import patch_docutils
+
+from exqudens_sphinx import fixups
+from exqudens_sphinx import docxbuilder_patch
+
+sources = {
+    'conf.py': "extensions = ['mlx.traceability', 'docxbuilder', 'exqudens_sphinx']\n",
+    'index.rst': 'Index\n=====\n\nSee :doc:`sub/a` and :ref:`label-b`.\n\n.. toctree::\n\n   sub/a\n   b\n',
+    'sub/a.rst': 'A\n=\n\nSee :doc:`../b`, :doc:`/index`, :ref:`label-b` and :item:`ITEM_B`.\n\n.. toctree::\n\n   c\n\n- item\n\n  #. nested\n',
+    'sub/c.rst': 'C\n=\n\nSee :doc:`a` and :any:`label-b`.\n\n.. note::\n\n   Note.\n',
+    'b.rst': '.. _label-b:\n\nB\n=\n\nSee :doc:`sub/c`.\n\n.. item:: ITEM_B Item\n\n   Text.\n\n.. list-table::\n\n   * - Key\n     - :doc:`sub/a`\n'
+}
+
+
+def pformat(tree):
+    # the ids of the expanded toctrees are made from 'id' by 'docxbuilder'
+    return re.sub(r'docx_expanded_toctree\d+', 'docx_expanded_toctree', tree.pformat())
+
+
+class DocxbuilderPatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = Path(tempfile.mkdtemp())
+        self.source_dir = self.work_dir.joinpath('source')
+        for name, text in sources.items():
+            self.source_dir.joinpath(name).parent.mkdir(parents=True, exist_ok=True)
+            self.source_dir.joinpath(name).write_text(text)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def build(self, **overrides):
+        app = Sphinx(
+            str(self.source_dir),
+            str(self.source_dir),
+            str(self.work_dir.joinpath('docx')),
+            str(self.work_dir.joinpath('doctrees')),
+            'docx',
+            confoverrides=overrides,
+            status=None,
+            warning=None
+        )
+        app.build()
+        return app
+
+    def test_cached_assemble_doctree(self):
+        # every included document is resolved with its own docname by both
+        with patch_docutils(str(self.source_dir)), docutils_namespace():
+            # nothing stored by the build
+            app = self.build(docxbuilder_assemble_doctree_cache=False, docxbuilder_assemble_doctree_chunked=False)
+
+            expected = docxbuilder_patch.docxbuilder_old_assemble_doctree(app.builder, 'index', False)
+            expected = fixups.fixups_fix_node(
+                expected,
+                include_self=False,
+                scope=app.config.docxbuilder_fix_node_scope,
+                dispatch=fixups.fixups_create_dispatch(app.config.docxbuilder_fix_node_rules)
+            )
+
+            # assembled twice, stored and then loaded
+            for i in range(2):
+                actual = docxbuilder_patch.docxbuilder_cached_assemble_doctree(app.builder, 'index', False)
+                self.assertEqual(pformat(expected), pformat(actual))
+                self.assertIn('refuri="../b#ITEM_B"', pformat(actual))
+
+
+if __name__ == '__main__':
+    unittest.main()
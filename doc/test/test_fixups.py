@@ -0,0 +1,225 @@
+# Tests of the single pass fixups and of 'log_node' against the recursive ones they replaced:
+#
+#   python -m unittest discover -s doc/test
+import sys
+import unittest
+from unittest import mock
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import docutils.nodes
+from sphinx import addnodes
+
+from exqudens_sphinx import util
+from exqudens_sphinx import fixups
+
+# the rules of the fixups before the large-table rule
+baseline_rules = [rule for rule in fixups.fixups_rules if rule['action'] != 'table']
+baseline_extract_from_paragraph = fixups.fixups_rules[0]['children']
+
+
+def baseline_find_nodes(node, class_names=None, index_key=None, include_self=False):
+    result = []
+
+    for n in node.traverse(include_self=include_self):
+        if n.__class__.__name__ in class_names:
+            n[index_key] = len(result)
+            result.append(n)
+
+    return result
+
+
+def baseline_fix_node(value):
+    # 'docxbuilder_fix_node' of the 'conf.py' of the baseline
+    if value.__class__.__name__ == 'table':
+        for table_node in value:
+            if table_node.__class__.__name__ == 'tgroup':
+                for tgroup_node in table_node:
+                    if tgroup_node.__class__.__name__ == 'colspec' and tgroup_node.get('colwidth') == 'auto':
+                        tgroup_node['colwidth'] = 10000
+        return value
+
+    result = fixups.fixups_unwrap(value, class_names=baseline_extract_from_paragraph)
+
+    for target_class_name in ['list_item', 'definition', 'note']:
+        target_index_key = 'docxbuilder_fix_desc_content_' + target_class_name + '_index'
+        target_nodes = baseline_find_nodes(result, class_names=[target_class_name], index_key=target_index_key)
+        target_nodes.reverse()
+        for node in target_nodes:
+            node_parent = node.parent
+            target_index = node[target_index_key]
+            for child_index, child in enumerate(node_parent):
+                if child.__class__.__name__ == target_class_name and child[target_index_key] == target_index:
+                    node_parent[child_index] = fixups.fixups_unwrap(node_parent[child_index], class_names=baseline_extract_from_paragraph)
+
+    for node in baseline_find_nodes(result, class_names=['enumerated_list'], index_key='docxbuilder_fix_desc_content_enumerated_list_index'):
+        fixups.fixups_update(node, attributes={'enumtype': 'arabic', 'prefix': '', 'suffix': '.', 'start': 1})
+
+    for node in baseline_find_nodes(result, class_names=['container'], index_key='docxbuilder_fix_desc_content_container_index'):
+        fixups.fixups_wrap(node, class_names=['emphasis'])
+
+    return result
+
+
+def baseline_fix_tree(tree):
+    # the loop of 'docxbuilder_new_assemble_doctree' of the 'conf.py' of the baseline
+    class_names = ['section', 'desc_content', 'table']
+    index_key = 'docxbuilder_new_assemble_doctree_index'
+    nodes = baseline_find_nodes(tree, class_names=class_names, index_key=index_key)
+    nodes.reverse()
+
+    for node in nodes:
+        node_parent = node.parent
+        for child_index, child in enumerate(node_parent):
+            if child.__class__.__name__ in class_names and child[index_key] == node[index_key]:
+                node_parent[child_index] = baseline_fix_node(node_parent[child_index])
+
+    for node in tree.traverse():
+        if isinstance(node, docutils.nodes.Element):
+            for key in [key for key in node.attributes if key.startswith('docxbuilder_')]:
+                del node[key]
+
+    return tree
+
+
+def baseline_log_node(node):
+    # 'log_node' of the 'conf.py' of the baseline, the logged paths
+    entries = []
+    for n in node.traverse():
+        if isinstance(n, docutils.nodes.Text) or len(n) == 0:
+            entry = []
+            while n is not None:
+                entry.append(n)
+                n = n.parent
+            entry.reverse()
+            entries.append([i.astext() if isinstance(i, docutils.nodes.Text) else i.__class__.__name__ for i in entry])
+    return [f"-- {entry}" for entry in entries]
+
+
+def paragraph(*children):
+    return docutils.nodes.paragraph('', '', *children)
+
+
+def text(value):
+    return docutils.nodes.Text(value)
+
+
+def table(rows, morerows=None, colwidth='auto'):
+    # 'morerows': the indexes of the body rows with a cell spanning the next ones, and the number of them
+    morerows = morerows or {}
+    tgroup = docutils.nodes.tgroup(cols=2)
+    tgroup += docutils.nodes.colspec(colwidth=colwidth)
+    tgroup += docutils.nodes.colspec(colwidth=colwidth)
+    thead = docutils.nodes.thead()
+    thead += docutils.nodes.row('', docutils.nodes.entry('', paragraph(text('Key'))), docutils.nodes.entry('', paragraph(text('Value'))))
+    tgroup += thead
+    tbody = docutils.nodes.tbody()
+    spanned = 0
+    for index in range(rows):
+        row = docutils.nodes.row()
+        if index >= spanned:
+            key = docutils.nodes.entry('', paragraph(text(f"key {index}")))
+            if index in morerows:
+                key['morerows'] = morerows[index]
+                spanned = index + morerows[index] + 1
+            row += key
+        row += docutils.nodes.entry('', paragraph(text(f"value {index}")))
+        tbody += row
+    tgroup += tbody
+    return docutils.nodes.table('', tgroup, ids=['table-1'])
+
+
+def tree():
+    document = docutils.nodes.document(None, None)
+
+    # out of the scope, only the table rules apply
+    document += paragraph(text('before'), table(2), text('after'))
+
+    desc_content = addnodes.desc_content()
+    desc_content += paragraph(text('desc'), docutils.nodes.literal_block('', 'code'), docutils.nodes.emphasis('', 'emphasis'))
+    desc_content += docutils.nodes.container('', docutils.nodes.emphasis('', 'wrapped'), paragraph(text('kept')))
+    desc = addnodes.desc()
+    desc += addnodes.desc_signature('', 'f()')
+    desc += desc_content
+
+    nested = docutils.nodes.section(ids=['nested'])
+    nested += docutils.nodes.title('', 'Nested')
+    nested += paragraph(text('table'), table(3), text('in a paragraph'))
+    nested += docutils.nodes.note('', paragraph(text('note'), docutils.nodes.image(uri='a.png')))
+    nested += desc
+
+    enumerated_list = docutils.nodes.enumerated_list(enumtype='loweralpha', prefix='(', suffix=')')
+    enumerated_list += docutils.nodes.list_item('', paragraph(text('item'), docutils.nodes.bullet_list('', docutils.nodes.list_item('', paragraph(text('inner'))))))
+    definition_list = docutils.nodes.definition_list()
+    definition_list += docutils.nodes.definition_list_item(
+        '', docutils.nodes.term('', 'term'), docutils.nodes.definition('', paragraph(text('definition'), docutils.nodes.math_block('', 'x')))
+    )
+
+    section = docutils.nodes.section(ids=['section'])
+    section += docutils.nodes.title('', 'Section')
+    section += paragraph(text('text'), enumerated_list, definition_list)
+    section += nested
+    section += docutils.nodes.section('', docutils.nodes.title('', 'Empty'), ids=['empty'])
+    document += section
+
+    return document
+
+
+class FixupsTest(unittest.TestCase):
+
+    def test_fix_node(self):
+        expected = baseline_fix_tree(tree())
+        actual = fixups.fixups_fix_node(tree(), include_self=False, dispatch=fixups.fixups_create_dispatch(baseline_rules))
+        self.assertEqual(expected.pformat(), actual.pformat())
+
+    def test_fix_node_rules(self):
+        # the large-table rule does not change the small tables
+        expected = fixups.fixups_fix_node(tree(), include_self=False, dispatch=fixups.fixups_create_dispatch(baseline_rules))
+        actual = fixups.fixups_fix_node(tree(), include_self=False)
+        self.assertEqual(expected.pformat(), actual.pformat())
+
+    def test_fix_node_large_table(self):
+        # a cell spanning over the first chunk boundary, the split is moved after it
+        rows = 2500
+        morerows = {998: 3, 1999: 1}
+
+        expected = tree()
+        expected.traverse(docutils.nodes.section)[1] += table(rows, morerows=morerows)
+        expected = baseline_fix_tree(expected)
+        expected_rows = [row.pformat() for row in expected.traverse(docutils.nodes.tbody)[-1]]
+
+        actual = tree()
+        nested = actual.traverse(docutils.nodes.section)[1]
+        nested += table(rows, morerows=morerows)
+        fixups.fixups_fix_node(actual, include_self=False)
+        tables = [node for node in nested if isinstance(node, docutils.nodes.table)][1:]
+
+        self.assertEqual([1002, 1000, 498], [len(node.traverse(docutils.nodes.tbody)[0]) for node in tables])
+        self.assertEqual([['table-1'], [], []], [node['ids'] for node in tables])
+        for node in tables:
+            self.assertEqual(['Key', 'Value'], [entry.astext() for entry in node.traverse(docutils.nodes.thead)[0][0]])
+            self.assertNotIn('auto', [colspec['colwidth'] for colspec in node.traverse(docutils.nodes.colspec)])
+            self.assertNotIn(10000, [colspec['colwidth'] for colspec in node.traverse(docutils.nodes.colspec)])
+        # the rows are moved to the chunks in their order, fixed the same as before the split
+        self.assertEqual(expected_rows, [row.pformat() for node in tables for row in node.traverse(docutils.nodes.tbody)[0]])
+
+    def test_log_node(self):
+        node = tree()
+        expected = baseline_log_node(node)
+        with mock.patch.object(util, 'logger') as logger:
+            util.log_node(node)
+        actual = [call.args[0] for call in logger.info.call_args_list if call.args[0].startswith('-- [')]
+        self.assertEqual(expected, actual)
+
+    def test_log_node_subtree(self):
+        node = tree().children[1].children[2]
+        expected = baseline_log_node(node)
+        with mock.patch.object(util, 'logger') as logger:
+            util.log_node(node)
+        actual = [call.args[0] for call in logger.info.call_args_list if call.args[0].startswith('-- [')]
+        self.assertEqual(expected, actual)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+# Tests of the relationship index against the relations of 'mlx.traceability':
+#
+#   python -m unittest discover -s doc/test
+import sys
+import types
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from mlx.traceable_item import TraceableItem
+from mlx.traceable_collection import TraceableCollection
+
+from exqudens_sphinx import traceability_patch
+
+
+def collection():
+    result = TraceableCollection()
+    result.add_relation_pair('depends_on', 'impacts_on')
+    result.add_relation_pair('validates', 'validated_by')
+    result.add_relation_pair('ext_tool')
+    for item_id in ['REQ-1', 'REQ-2', 'REQ-10', 'TEST-1', 'TEST-2']:
+        result.add_item(TraceableItem(item_id))
+    result.add_relation('REQ-1', 'depends_on', 'REQ-10')
+    result.add_relation('REQ-1', 'depends_on', 'REQ-2')
+    # the placeholders, a source and a target
+    result.add_relation('REQ-1', 'depends_on', 'REQ-3')
+    result.add_relation('DESIGN-1', 'depends_on', 'REQ-2')
+    result.add_relation('TEST-2', 'validates', 'REQ-10')
+    result.add_relation('TEST-2', 'validates', 'REQ-1')
+    result.add_relation('TEST-2', 'ext_tool', 'tool:abc')
+    # a relation without targets
+    result.get_item('TEST-1').explicit_relations['validates'] = []
+    return result
+
+
+def process_relationships(function, item):
+    calls = []
+    stub = types.SimpleNamespace(
+        _item=item,
+        _list_targets_for_relation=lambda relation, targets, *args: calls.append((relation, list(targets)))
+    )
+    function(stub)
+    return calls
+
+
+class TraceabilityPatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = collection()
+        self.index = {}
+        traceability_patch.traceability_update_index(self.index, self.collection)
+
+    def tearDown(self):
+        traceability_patch.traceability_index = None
+
+    def test_are_related(self):
+        item_ids = list(self.collection.items) + ['UNKNOWN', 'tool:abc']
+        for relations in [[], ['depends_on'], ['impacts_on', 'validated_by'], ['ext_tool']]:
+            for source_id in item_ids:
+                for target_id in item_ids:
+                    traceability_patch.traceability_index = None
+                    expected = traceability_patch.traceability_old_are_related(self.collection, source_id, relations, target_id)
+                    traceability_patch.traceability_index = self.index
+                    actual = traceability_patch.traceability_are_related(self.collection, source_id, relations, target_id)
+                    self.assertEqual(expected, actual, (source_id, relations, target_id))
+
+    def test_process_relationships(self):
+        for item in self.collection.items.values():
+            traceability_patch.traceability_index = None
+            expected = process_relationships(traceability_patch.traceability_old_process_relationships, item)
+            traceability_patch.traceability_index = self.index
+            actual = process_relationships(traceability_patch.traceability_process_relationships, item)
+            self.assertEqual(expected, actual, item.identifier)
+
+    def test_add_internal_targets(self):
+        targets_with_ids = [['REQ-10', 'REQ-2', 'REQ-3', 'REQ-1'], ['TEST-2', 'DESIGN-1', 'UNKNOWN']]
+        for relations in [[], ['depends_on'], ['impacts_on', 'validated_by']]:
+            for source_id in list(self.collection.items) + ['UNKNOWN']:
+                traceability_patch.traceability_index = None
+                expected_cells = [[], []]
+                expected = traceability_patch.traceability_old_add_internal_targets.__func__(
+                    expected_cells, source_id, targets_with_ids, relations, self.collection
+                )
+                traceability_patch.traceability_index = self.index
+                actual_cells = [[], []]
+                actual = traceability_patch.traceability_add_internal_targets(
+                    actual_cells, source_id, targets_with_ids, relations, self.collection
+                )
+                self.assertEqual((expected, expected_cells), (actual, actual_cells), (source_id, relations))
+
+    def test_update_index(self):
+        self.assertEqual(0, traceability_patch.traceability_update_index(self.index, self.collection))
+        self.collection.add_relation('TEST-1', 'validates', 'REQ-2')
+        self.assertEqual(2, traceability_patch.traceability_update_index(self.index, self.collection))
+        self.assertEqual(
+            process_relationships(traceability_patch.traceability_old_process_relationships, self.collection.get_item('REQ-2')),
+            [(relation, list(targets)) for relation, targets in self.index['REQ-2']['sorted']]
+        )
+
+
+class TraceabilityUpdateConfigTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = Path(tempfile.mkdtemp())
+        self.source_dir = self.work_dir.joinpath('source')
+        self.source_dir.mkdir()
+        self.source_dir.joinpath('conf.py').write_text(
+            "extensions = ['mlx.traceability', 'exqudens_sphinx']\n"
+            "traceability_attributes = {'value': '^.*$'}\n"
+            "traceability_attribute_to_string = {'value': 'Value'}\n"
+            "traceability_checklist = {'attribute_name': 'checked', 'attribute_to_str': 'Checked', 'attribute_values': 'yes,no'}\n"
+        )
+        self.source_dir.joinpath('index.rst').write_text('Index\n=====\n\n.. item:: REQ-1 Req\n\n.. toctree::\n\n   other\n')
+        self.source_dir.joinpath('other.rst').write_text('Other\n=====\n\nText.\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def build(self):
+        app = Sphinx(
+            str(self.source_dir),
+            str(self.source_dir),
+            str(self.work_dir.joinpath('html')),
+            str(self.work_dir.joinpath('doctrees')),
+            'html',
+            status=None,
+            warning=None
+        )
+        docnames = []
+        app.connect('env-before-read-docs', lambda app, env, read: docnames.extend(read))
+        app.build()
+        return docnames
+
+    def test_update_config(self):
+        self.assertEqual(['index', 'other'], sorted(self.build()))
+        self.assertIs(traceability_patch.traceability_old_update_config, BuildEnvironment._update_config)
+        # the configuration changed by 'mlx.traceability' is not a change of the configuration,
+        # only the documents with items are read again, see 'traceability_patch.env_get_outdated'
+        self.assertEqual(['index'], self.build())
+        self.assertIs(traceability_patch.traceability_old_update_config, BuildEnvironment._update_config)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -27,6 +27,7 @@ namespace exqudens {
 
   TEST_F(Tests, test3) {
     try {
+      RecordProperty("requirements", "REQUIREMENT_1");
       std::cout << "executableDir: '" + TestUtils::getExecutableDir() + "'\n";
       std::string expected = "aaa ";
       std::cout << "expected: '" + expected + "'\n";
@@ -41,6 +42,7 @@ namespace exqudens {
 
   TEST_F(Tests, test4) {
     try {
+      RecordProperty("requirements", "REQUIREMENT_2");
       std::cout << "executableDir: '" + TestUtils::getExecutableDir() + "'\n";
       std::string expected = " aaa";
       std::cout << "expected: '" + expected + "'\n";
@@ -55,6 +57,7 @@ namespace exqudens {
 
   TEST_F(Tests, test5) {
     try {
+      RecordProperty("requirements", "REQUIREMENT_3");
       std::cout << "executableDir: '" + TestUtils::getExecutableDir() + "'\n";
       std::string expected = "aaa";
       std::cout << "expected: '" + expected + "'\n";